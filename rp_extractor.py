@@ -7,7 +7,7 @@ Russian Post PDF Extractor — CLI (GUI-compatible)
 - Совместим с GUI: поддерживает --progress-stdout, --cancel-file, --debug-dump-text, --log
 """
 
-import argparse, os, re, sys, csv, json, logging, concurrent.futures
+import argparse, os, re, sys, csv, io, json, hashlib, logging, mmap, shlex, sqlite3, subprocess, tempfile, threading, time, concurrent.futures
 import importlib.util
 
 
@@ -24,35 +24,97 @@ def _has_module(name: str) -> bool:
         # обрабатываем её и считаем, что модуль недоступен.
         return False
 
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Callable, Optional, Dict, List, Tuple, Union
+from typing import Callable, Iterator, Optional, Dict, List, Tuple, Union
 
 logger = logging.getLogger("rp_extractor")
 
 DEBUG_DUMP_DIR: Optional[str] = None
+# Путь к файлу лога, настроенному через --log; нужен дочерним процессам пула.
+LOG_PATH: Optional[str] = None
+# Путь к дисковому кэшу текстов страниц (слой и OCR); None — кэш выключен
+# (--no-cache или вызов из кода).
+OCR_CACHE_PATH: Optional[str] = None
 # Формат трек-номера: всегда 14 цифр, начинающихся с «8».
 TRACK14 = r"8\d{13}"
 
 # Регулярные выражения, описывающие типичные подписи и окружения в уведомлениях.
+# Используется стандартный re, а не re2: в re2 \b понимает только ASCII, и
+# проверки вида \bкод перестали бы работать на кириллице. Линейное время
+# обеспечиваем самими шаблонами: без обратных ссылок и вложенных повторов,
+# все повторы между фрагментами подписи и цифрами ограничены.
 LOGO_RE = re.compile(r"почта\s+россии", re.I)
 
+# Повторы внутри подписей ограничены: неограниченный [а-я\s]* после «почтов»
+# на каждом вхождении просматривал весь последующий кириллический текст, что на
+# длинных OCR-страницах давало квадратичное время.
 TRACK_LABEL_RE = re.compile(
-    r"(трек\s*[-№]*\s*номер|почтов[а-я\s]*идентификатор|идентификатор\s+отправления|шпи|штрих\s*код)",
+    r"(трек[\s\-№]{0,5}номер|почтов[а-яё]{0,15}\s{0,5}идентификатор|идентификатор\s+отправления|шпи|штрих[\s\-]{0,3}код)",
     re.I,
 )
 CODE_LABEL_RE = re.compile(
     r"(код\s*(?:доступа|для\s+получения|получения|письма)|доступ\s*код)",
     re.I,
 )
+# Объединённый шаблон подписей: одним проходом находим и подписи трека, и
+# подписи кода; тип подписи определяется по именованной группе.
+_LABEL_RE = re.compile(
+    f"(?P<track>{TRACK_LABEL_RE.pattern})|(?P<code>{CODE_LABEL_RE.pattern})",
+    re.I,
+)
 TRACK_CONTEXT_RE = re.compile(r"(трек|идентификатор|почтов|шпи|штрих)", re.I)
 CODE_CONTEXT_RE = re.compile(r"(\bкод\b|\bдоступ|\bполуч|\bписьм)", re.I)
 
-TRACK_SEQ_RE = re.compile(r"8(?:[\s\u00a0-]*\d){13}")
-CODE_SEQ_RE = re.compile(r"\d(?:[\s\u00a0-]*\d){7}")
+# Между цифрами допускаем не больше восьми разделителей: этого хватает для
+# «8006 5036», пустых строк и отступов pdfminer и двойных пробелов OCR, а
+# ограниченный повтор не даёт движку перебирать длинные пробельные хвосты на
+# каждой из 13 итераций.
+TRACK_SEQ_RE = re.compile(r"8(?:[\s-]{0,8}\d){13}")
+CODE_SEQ_RE = re.compile(r"\d(?:[\s-]{0,8}\d){7}")
+
+# Нормализация текста перед поиском одним вызовом str.translate: неразрывные
+# пробелы превращаем в обычные, а варианты дефиса и минуса — в «-», чтобы
+# шаблонам выше хватало простого класса [\s-].
+_NORM_TABLE = str.maketrans(
+    {
+        "\xa0": " ",
+        "\u2007": " ",
+        "\u202f": " ",
+        "\u2010": "-",
+        "\u2011": "-",
+        "\u2012": "-",
+        "\u2013": "-",
+        "\u2212": "-",
+    }
+)
+
+# Символы, которые заменяются в именах файлов отладочного дампа.
+_UNSAFE_NAME_RE = re.compile(r"[^A-Za-z0-9_.-]")
+
+# Все символы, которые TRACK_SEQ_RE/CODE_SEQ_RE допускают между цифрами:
+# дефис и всё, что в Python-шаблонах совпадает с \s. Удаление через
+# str.translate работает одним проходом на C без запуска движка regex.
+# После него от совпадения остаются ровно цифры шаблона — 14 с «8» в начале
+# или 8, — поэтому длину и формат результата отдельно не проверяем.
+_SEPARATOR_CHARS = (
+    "-\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f \x85\xa0\u1680"
+    + "".join(map(chr, range(0x2000, 0x200B)))
+    + "\u2028\u2029\u202f\u205f\u3000"
+)
+_SEPARATOR_DELETE = str.maketrans("", "", _SEPARATOR_CHARS)
+# Цифра на той же строке вплотную к совпадению или через пробелы и дефисы:
+# такие восемь цифр — часть более длинного числа (телефона, ИНН, трека).
+_DIGIT_BEFORE_RE = re.compile(r"\d[ \t-]{0,8}\Z")
+_DIGIT_AFTER_RE = re.compile(r"[ \t-]{0,8}\d")
+# Что может стоять между подписью и числом сразу после неё.
+_LABEL_GAP_RE = re.compile(r"[\s:.№#-]*")
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class _NumberCandidate:
     """Хранит найденную числовую последовательность с метаданными."""
 
@@ -62,6 +124,170 @@ class _NumberCandidate:
     score: int
 
 
+class _LRUCache:
+    """Потокобезопасный LRU-кэш ограниченного размера."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[object, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Возвращает значение и помечает ключ как недавно использованный."""
+
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def put(self, key, value) -> None:
+        """Сохраняет значение, вытесняя самые старые записи при переполнении."""
+
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        """Очищает кэш."""
+
+        with self._lock:
+            self._data.clear()
+
+
+# Тексты страниц в пределах процесса: повторная обработка того же PDF (перезапуск
+# по папке, повтор из GUI) не парсит и не распознаёт страницы заново. Ключ
+# включает mtime файла, поэтому изменённый PDF обрабатывается с нуля.
+_PAGE_TEXT_CACHE = _LRUCache(maxsize=2048)
+_OCR_TEXT_CACHE = _LRUCache(maxsize=512)
+
+
+# Сколько записей хранит дисковый кэш. Тексты страниц — единицы килобайт,
+# так что файл не вырастает больше нескольких сотен мегабайт; при
+# переполнении удаляются записи, которые дольше всех не читались.
+DISK_CACHE_MAX_ENTRIES = 50000
+# Как часто (в записях) процесс проверяет размер кэша.
+_DISK_CACHE_PRUNE_EVERY = 256
+
+
+class _DiskCache:
+    """Постоянный кэш текстов в SQLite, переживающий перезапуски CLI."""
+
+    def __init__(self, path: str, max_entries: int = DISK_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._puts = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Соединение SQLite нельзя наследовать через fork, поэтому в каждом
+        # процессе пула открываем своё.
+        if self._conn is None or self._pid != os.getpid():
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Отметка чтения пишется при каждом попадании; в режиме WAL
+            # синхронизации при контрольной точке для кэша достаточно.
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, accessed INTEGER NOT NULL DEFAULT 0)"
+            )
+            # Файлы кэша прежних версий не содержат отметки последнего чтения.
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(cache)")}
+            if "accessed" not in columns:
+                conn.execute("ALTER TABLE cache ADD COLUMN accessed INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+            self._conn, self._pid, self._puts = conn, os.getpid(), 0
+            self._prune(conn)
+        return self._conn
+
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        # Оставляем max_entries записей, прочитанных или записанных последними.
+        conn.execute(
+            "DELETE FROM cache WHERE key IN "
+            "(SELECT key FROM cache ORDER BY accessed DESC, rowid DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        conn.commit()
+
+    @staticmethod
+    def _digest(key) -> str:
+        return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+    def get(self, key) -> Optional[str]:
+        """Возвращает сохранённый текст или None."""
+
+        digest = self._digest(key)
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute("SELECT value FROM cache WHERE key = ?", (digest,)).fetchone()
+                if row:
+                    conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (time.time_ns(), digest))
+                    conn.commit()
+        except Exception:
+            logger.debug("Disk cache read failed (%s)", self.path, exc_info=True)
+            return None
+        return row[0] if row else None
+
+    def put(self, key, value: str) -> None:
+        """Сохраняет текст; ошибки записи только логируются."""
+
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, accessed) VALUES (?, ?, ?)",
+                    (self._digest(key), value, time.time_ns()),
+                )
+                conn.commit()
+                self._puts += 1
+                if self._puts % _DISK_CACHE_PRUNE_EVERY == 0:
+                    self._prune(conn)
+        except Exception:
+            logger.debug("Disk cache write failed (%s)", self.path, exc_info=True)
+
+
+_DISK_CACHE: Optional[_DiskCache] = None
+
+
+def _default_cache_path() -> str:
+    """Возвращает путь к файлу кэша в пользовательском каталоге кэшей."""
+
+    base = os.environ.get("XDG_CACHE_HOME")
+    if not base and os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA")
+    if not base:
+        base = str(Path.home() / ".cache")
+    return str(Path(base) / "pdpost-extractor" / "ocr.sqlite")
+
+
+def _configure_disk_cache(path: Optional[str]) -> None:
+    """Включает дисковый кэш текстов по указанному пути или выключает его."""
+
+    global OCR_CACHE_PATH, _DISK_CACHE
+    OCR_CACHE_PATH = path or None
+    _DISK_CACHE = _DiskCache(path) if path else None
+
+
+def _file_stamp(pdf_path: Path) -> Optional[Tuple[int, int]]:
+    """Возвращает (mtime в наносекундах, размер) файла или None, если файл недоступен."""
+
+    try:
+        st = os.stat(pdf_path)
+    except OSError:
+        return None
+    # Размер ловит перезапись файла в пределах грубой метки времени ФС
+    # (FAT, сетевые диски), при которой mtime не меняется.
+    return st.st_mtime_ns, st.st_size
+
+
 # Проверяем доступность зависимостей, чтобы подбирать рабочие методы извлечения текста.
 _pdfminer_available = _has_module("pdfminer.high_level")
 if _pdfminer_available:
@@ -69,9 +295,22 @@ if _pdfminer_available:
     from pdfminer.pdfpage import PDFPage
     from pdfminer.pdfparser import PDFParser
     from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdftypes import resolve1
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
 else:  # pragma: no cover - exercised via fallback branches
     extract_text = None  # type: ignore
-    PDFPage = PDFParser = PDFDocument = None  # type: ignore
+    PDFPage = PDFParser = PDFDocument = resolve1 = None  # type: ignore
+    TextConverter = LAParams = PDFPageInterpreter = PDFResourceManager = None  # type: ignore
+
+# PyMuPDF необязателен: если он установлен, текстовый слой читается им — это
+# библиотека на C, на порядок быстрее pdfminer; pdfminer остаётся запасным путём.
+_pymupdf_available = _has_module("fitz")
+if _pymupdf_available:
+    import fitz
+else:  # pragma: no cover - exercised via fallback branches
+    fitz = None  # type: ignore
 
 _pdf2image_available = _has_module("pdf2image")
 _pytesseract_available = _has_module("pytesseract")
@@ -108,6 +347,8 @@ def _configure_logging(log_path: str) -> None:
         root = logging.getLogger()
         root.setLevel(logging.INFO)
         root.addHandler(handler)
+        global LOG_PATH
+        LOG_PATH = str(path)
     except Exception:
         # Ошибки конфигурации логирования не должны прерывать работу
         # приложения, поэтому просто фиксируем их в стандартном логере.
@@ -129,28 +370,187 @@ if os.name == "nt" and pytesseract is not None:
         pytesseract.pytesseract.tesseract_cmd = tp
 
 
+class _PdfDocument:
+    """PDF, который разбирается один раз на все запрошенные страницы."""
+
+    def __init__(self, pdf_path: Path) -> None:
+        self.path = str(pdf_path)
+        self._fitz_doc = None
+        self._fh = None
+        self._mm: Optional[mmap.mmap] = None
+        self._doc = None
+        self._pages: Optional[list] = None
+        self._rsrcmgr = None
+        self._laparams = None
+
+    def _open_fitz(self):
+        if self._fitz_doc is None:
+            self._fitz_doc = fitz.open(self.path)
+        return self._fitz_doc
+
+    def _open(self):
+        # Файл открываем лениво: если все нужные страницы уже есть в кэше,
+        # разбирать PDF не придётся вовсе.
+        if self._doc is None:
+            self._fh = open(self.path, "rb")
+            # pdfminer читает файл множеством мелких seek/read; через mmap они
+            # обслуживаются из страничного кэша без системных вызовов, а ОС
+            # подгружает только те части файла, на которые ссылается xref.
+            # Пустые файлы и ФС без поддержки mmap читаем обычным образом.
+            try:
+                self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                self._mm = None
+            self._doc = PDFDocument(PDFParser(self._mm if self._mm is not None else self._fh))
+        return self._doc
+
+    def _load(self) -> list:
+        if self._pages is None:
+            self._pages = list(PDFPage.create_pages(self._open()))
+            self._rsrcmgr = PDFResourceManager(caching=True)
+            self._laparams = LAParams()
+        return self._pages
+
+    def page_count(self) -> int:
+        """Возвращает число страниц из /Count или по списку страниц."""
+
+        if fitz is not None:
+            try:
+                return self._open_fitz().page_count
+            except Exception:
+                logger.debug("PyMuPDF failed to open %s", self.path, exc_info=True)
+        # Корень дерева страниц хранит их общее число в /Count — читаем его
+        # вместо создания объекта на каждую страницу. Если /Count отсутствует
+        # или испорчен, перебираем страницы: PDFPage сам обрабатывает
+        # внутренние структуры документа.
+        count = _catalog_page_count(self._open())
+        return count if count is not None else len(self._load())
+
+    def page_text(self, pidx: int) -> str:
+        """Извлекает текст страницы через PyMuPDF, а при его отсутствии или сбое — pdfminer."""
+
+        return self.page_text_with_source(pidx)[0]
+
+    def page_text_with_source(self, pidx: int) -> Tuple[str, str]:
+        """Возвращает текст страницы и имя извлекшей его библиотеки ("fitz" или "pdfminer")."""
+
+        if fitz is not None:
+            try:
+                return self._open_fitz().load_page(pidx).get_text("text"), "fitz"
+            except Exception:
+                logger.debug("PyMuPDF failed on %s page %s", self.path, pidx + 1, exc_info=True)
+        # Текст получается таким же, как у pdfminer.high_level.extract_text.
+        page = self._load()[pidx]
+        buf = io.StringIO()
+        device = TextConverter(self._rsrcmgr, buf, laparams=self._laparams)
+        try:
+            PDFPageInterpreter(self._rsrcmgr, device).process_page(page)
+        finally:
+            device.close()
+        return buf.getvalue(), "pdfminer"
+
+    def close(self) -> None:
+        if self._fitz_doc is not None:
+            self._fitz_doc.close()
+            self._fitz_doc = None
+        self._doc = None
+        self._pages = None
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+# Документ, открытый process_pdf для текущего потока. Пул потоков обрабатывает
+# разные файлы параллельно, поэтому хранилище у каждого потока своё.
+_OPEN_DOCUMENT = threading.local()
+
+
+@contextmanager
+def _pdf_document_scope(pdf_path: Path):
+    """Держит PDF открытым, пока обрабатывается файл."""
+
+    if fitz is None and (not _pdfminer_available or PDFParser is None):
+        yield None
+        return
+    doc = _PdfDocument(pdf_path)
+    prev = getattr(_OPEN_DOCUMENT, "doc", None)
+    _OPEN_DOCUMENT.doc = doc
+    try:
+        yield doc
+    finally:
+        _OPEN_DOCUMENT.doc = prev
+        doc.close()
+
+
+def _current_document(pdf_path: Path) -> Optional[_PdfDocument]:
+    """Возвращает открытый документ для pdf_path, если он есть в текущем потоке."""
+
+    doc = getattr(_OPEN_DOCUMENT, "doc", None)
+    if doc is not None and doc.path == str(pdf_path):
+        return doc
+    return None
+
+
 def extract_page_text_pdfminer(pdf_path: Path, pidx: int) -> str:
-    """Извлекает текст страницы PDF с помощью pdfminer."""
+    """Извлекает текст страницы PDF с помощью pdfminer (или PyMuPDF внутри process_pdf)."""
 
-    if not _pdfminer_available or extract_text is None:
+    doc = _current_document(pdf_path)
+    if doc is None and (not _pdfminer_available or extract_text is None):
         # Если библиотека не установлена (например, в portable-версии),
         # возвращаем пустую строку, чтобы вызвать резервные механизмы.
         return ""
+    stamp = _file_stamp(pdf_path)
+    # Абсолютный путь: относительный, как его передали в командной строке,
+    # зависел бы от рабочего каталога, и дисковый кэш не находил бы записи.
+    # Ключ включает библиотеку, извлёкшую текст: разметка PyMuPDF и pdfminer
+    # различается, и после установки или удаления PyMuPDF текст другой
+    # библиотеки из кэша не берём. Ищем запись той библиотеки, которая
+    # сработает сейчас; текст, полученный pdfminer после сбоя PyMuPDF, при
+    # доступном PyMuPDF из кэша не берётся.
+    path_key = os.path.abspath(pdf_path)
+    source = "fitz" if doc is not None and fitz is not None else "pdfminer"
+    key = (path_key, stamp, pidx, source)
+    if stamp is not None:
+        cached = _PAGE_TEXT_CACHE.get(key)
+        if cached is None and _DISK_CACHE is not None:
+            # Повторный запуск CLI по той же папке берёт текст из SQLite, не
+            # разбирая PDF заново.
+            cached = _DISK_CACHE.get(key)
+            if cached is not None:
+                _PAGE_TEXT_CACHE.put(key, cached)
+        if cached is not None:
+            return cached
+    parsed = False
     try:
-        # pdfminer позволяет извлечь текст конкретной страницы по индексу.
-        return extract_text(str(pdf_path), page_numbers=[pidx]) or ""
+        if doc is not None:
+            # Внутри process_pdf документ уже разобран: берём страницу из него,
+            # не перечитывая xref и дерево страниц заново.
+            text, source = doc.page_text_with_source(pidx)
+            text = text or ""
+        else:
+            # pdfminer позволяет извлечь текст конкретной страницы по индексу.
+            text = extract_text(str(pdf_path), page_numbers=[pidx]) or ""
+        parsed = True
     except Exception:
         # PDF-файлы бывают "сломанными"; игнорируем ошибки, чтобы позднее
         # попробовать OCR или следующую страницу.
-        return ""
+        text = ""
+    if stamp is not None:
+        key = (path_key, stamp, pidx, source)
+        _PAGE_TEXT_CACHE.put(key, text)
+        # На диск попадает только успешно разобранная страница: сбой чтения
+        # может быть временным.
+        if parsed and _DISK_CACHE is not None:
+            _DISK_CACHE.put(key, text)
+    return text
 
 
-def extract_page_text_ocr(pdf_path: Path, pidx: int, dpi: int = 300, lang: str = "rus+eng") -> str:
-    """Делает OCR страницы PDF и возвращает распознанный текст."""
+def _poppler_kwargs() -> Dict[str, str]:
+    """Возвращает аргумент poppler_path для pdf2image, если Poppler найден."""
 
-    if not OCR_AVAILABLE or convert_from_path is None or pytesseract is None:
-        # Если нет poppler/pdf2image или pytesseract, OCR недоступен.
-        return ""
     poppler_path = os.environ.get("POPPLER_PATH")
     if not poppler_path:
         # В сборках PyInstaller зависимость poppler может поставляться рядом с
@@ -159,36 +559,317 @@ def extract_page_text_ocr(pdf_path: Path, pidx: int, dpi: int = 300, lang: str =
         cand = base / "poppler" / "bin"
         if cand.is_dir():
             poppler_path = str(cand)
-    kwargs = {"dpi": dpi, "first_page": pidx + 1, "last_page": pidx + 1}
     if poppler_path and os.path.isdir(poppler_path):
-        kwargs["poppler_path"] = poppler_path
+        return {"poppler_path": poppler_path}
+    return {}
+
+
+def _ocr_cache_key(
+    pdf_path: Path,
+    pidx: int,
+    dpi: int,
+    lang: str,
+    config: str = "",
+    backend: str = "tesseract",
+    binarize: bool = False,
+    crop: bool = False,
+):
+    """Строит ключ кэша OCR или возвращает None, если файл недоступен."""
+
+    stamp = _file_stamp(pdf_path)
+    if stamp is None:
+        return None
+    return (os.path.abspath(pdf_path), stamp, pidx, dpi, lang, config, backend, binarize, crop)
+
+
+def _binarize(image):
+    """Переводит страницу в чёрно-белое изображение с растянутым контрастом."""
+
     try:
-        # convert_from_path рендерит страницу PDF в изображение, которое затем
-        # передаётся в pytesseract для распознавания.
-        imgs = convert_from_path(str(pdf_path), **kwargs)
-        if not imgs:
+        from PIL import ImageOps
+
+        gray = ImageOps.autocontrast(image.convert("L"))
+        # На однобитном изображении Tesseract пропускает собственную
+        # бинаризацию, а фон скана с шумом не превращается в ложные символы.
+        return gray.point(lambda p: 255 if p > 128 else 0, mode="1")
+    except Exception:
+        logger.debug("Failed to binarize page image", exc_info=True)
+        return image
+
+
+def _crop_label_bands(image):
+    """Оставляет от страницы верхнюю треть и нижнюю четверть, склеенные в одно изображение."""
+
+    try:
+        from PIL import Image
+
+        # На бланках Почты трек и код почти всегда в шапке или в отрывной
+        # части внизу; середина страницы — адреса и текст письма.
+        w, h = image.size
+        top = image.crop((0, 0, w, h // 3))
+        bottom = image.crop((0, 3 * h // 4, w, h))
+        bands = Image.new(image.mode, (w, top.height + bottom.height), "white")
+        bands.paste(top, (0, 0))
+        bands.paste(bottom, (0, top.height))
+        return bands
+    except Exception:
+        logger.debug("Failed to crop page image", exc_info=True)
+        return image
+
+
+def _prepare_ocr_image(image, binarize: bool = False, crop: bool = False):
+    """Применяет к странице выбранную предобработку перед OCR."""
+
+    # Сначала обрезаем: бинаризовать меньше пикселей.
+    if crop:
+        image = _crop_label_bands(image)
+    if binarize:
+        image = _binarize(image)
+    return image
+
+
+def _cached_ocr_text(key) -> Optional[str]:
+    """Ищет распознанный текст в памяти, затем в дисковом кэше."""
+
+    if key is None:
+        return None
+    text = _OCR_TEXT_CACHE.get(key)
+    if text is None and _DISK_CACHE is not None:
+        text = _DISK_CACHE.get(key)
+        if text is not None:
+            _OCR_TEXT_CACHE.put(key, text)
+    return text
+
+
+def render_pages_for_ocr(pdf_path: Path, pidx_list: List[int], dpi: int = 300) -> Dict[int, object]:
+    """Рендерит несколько страниц одним вызовом Poppler и возвращает {индекс: изображение}."""
+
+    if not pidx_list or not OCR_AVAILABLE or convert_from_path is None:
+        return {}
+    # Один запуск pdftoppm на каждый непрерывный диапазон вместо отдельного
+    # процесса, повторного разбора PDF и загрузки шрифтов на каждую страницу.
+    # Страницы в разрывах (например, уже взятые из кэша) не рендерим:
+    # растеризация страницы дороже запуска процесса.
+    runs: List[List[int]] = []
+    for pidx in sorted(set(pidx_list)):
+        if runs and pidx == runs[-1][1] + 1:
+            runs[-1][1] = pidx
+        else:
+            runs.append([pidx, pidx])
+    images: Dict[int, object] = {}
+    for first, last in runs:
+        try:
+            imgs = convert_from_path(
+                str(pdf_path),
+                dpi=dpi,
+                first_page=first + 1,
+                last_page=last + 1,
+                grayscale=True,
+                **_poppler_kwargs(),
+            )
+        except Exception:
+            logger.debug("Failed to render pages %s-%s of %s", first + 1, last + 1, pdf_path, exc_info=True)
+            continue
+        images.update((first + i, img) for i, img in enumerate(imgs) if first + i <= last)
+    return images
+
+
+def _store_ocr_text(key, text: str) -> None:
+    """Сохраняет распознанный текст в кэш в памяти и на диске."""
+
+    if key is None:
+        return
+    _OCR_TEXT_CACHE.put(key, text)
+    if _DISK_CACHE is not None:
+        _DISK_CACHE.put(key, text)
+
+
+def ocr_pages_batch(
+    pdf_path: Path,
+    images: Dict[int, object],
+    dpi: int = 300,
+    lang: str = "rus+eng",
+    config: str = "",
+    binarize: bool = False,
+    crop: bool = False,
+) -> Dict[int, str]:
+    """Распознаёт несколько страниц одним запуском Tesseract и кладёт тексты в кэш OCR.
+
+    Возвращает {индекс страницы: текст}; при любой ошибке — пустой словарь,
+    и страницы распознаются по одной обычным путём.
+    """
+
+    if len(images) < 2 or pytesseract is None:
+        return {}
+    order = sorted(images)
+    try:
+        with tempfile.TemporaryDirectory(prefix="rp_ocr_") as tmp:
+            # Tesseract принимает текстовый файл со списком изображений и
+            # выводит страницы подряд, разделяя их символом \f — так запуск
+            # процесса и загрузка модели происходят один раз на файл.
+            paths = []
+            for pidx in order:
+                img_path = os.path.join(tmp, f"p{pidx}.png")
+                _prepare_ocr_image(images[pidx], binarize, crop).save(img_path)
+                paths.append(img_path)
+            list_file = os.path.join(tmp, "pages.txt")
+            with open(list_file, "w", encoding="utf-8") as fh:
+                fh.write("\n".join(paths) + "\n")
+            out_stem = os.path.join(tmp, "out")
+            cmd = [pytesseract.pytesseract.tesseract_cmd, list_file, out_stem, "-l", lang]
+            cmd += shlex.split(config)
+            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            with open(out_stem + ".txt", encoding="utf-8") as fh:
+                chunks = fh.read().split("\f")
+    except Exception:
+        logger.debug("Batch OCR failed for %s", pdf_path, exc_info=True)
+        return {}
+    # После последней страницы тоже стоит \f, поэтому частей на одну больше.
+    if len(chunks) < len(order):
+        logger.debug("Batch OCR returned %d pages instead of %d for %s", len(chunks), len(order), pdf_path)
+        return {}
+    texts = dict(zip(order, chunks))
+    for pidx, text in texts.items():
+        key = _ocr_cache_key(pdf_path, pidx, dpi, lang, config, binarize=binarize, crop=crop)
+        _store_ocr_text(key, text)
+    return texts
+
+
+# Экземпляр PaddleOCR загружает нейросетевые модели несколько секунд, поэтому
+# создаётся один раз на процесс. Импорт тоже отложен: paddle тяжёлый и нужен
+# только при --ocr-backend paddle.
+_PADDLE_ENGINE = None
+_PADDLE_FAILED = False
+_PADDLE_LOCK = threading.Lock()
+
+
+def _paddle_engine():
+    """Возвращает общий экземпляр PaddleOCR или None, если он недоступен."""
+
+    global _PADDLE_ENGINE, _PADDLE_FAILED
+    with _PADDLE_LOCK:
+        if _PADDLE_ENGINE is None and not _PADDLE_FAILED:
+            try:
+                from paddleocr import PaddleOCR
+
+                # Устройство (GPU или CPU) paddle выбирает сам по своей сборке.
+                _PADDLE_ENGINE = PaddleOCR(lang="ru", use_angle_cls=False)
+            except Exception:
+                logger.warning("PaddleOCR is unavailable, falling back to Tesseract", exc_info=True)
+                _PADDLE_FAILED = True
+        return _PADDLE_ENGINE
+
+
+def _paddle_image_to_string(engine, image) -> str:
+    """Распознаёт изображение PaddleOCR и склеивает найденные строки."""
+
+    import numpy as np
+
+    # Модель не рассчитана на одновременные вызовы из нескольких потоков.
+    with _PADDLE_LOCK:
+        result = engine.ocr(np.asarray(image.convert("RGB")), cls=False)
+    lines = []
+    for page in result or []:
+        for item in page or []:
+            lines.append(item[1][0])
+    return "\n".join(lines)
+
+
+def extract_page_text_ocr(
+    pdf_path: Path,
+    pidx: int,
+    dpi: int = 300,
+    lang: str = "rus+eng",
+    image=None,
+    config: str = "",
+    backend: str = "tesseract",
+    binarize: bool = False,
+    crop: bool = False,
+) -> str:
+    """Делает OCR страницы PDF и возвращает распознанный текст.
+
+    Если передан ``image`` (уже отрендеренная страница), Poppler не вызывается.
+    ``config`` передаётся Tesseract как есть (например, ``--psm 6``).
+    ``backend="paddle"`` распознаёт PaddleOCR, а если он не загрузился — Tesseract.
+    ``binarize`` переводит страницу в чёрно-белую перед распознаванием, ``crop``
+    оставляет только верх и низ страницы, где обычно стоят трек и код.
+    """
+
+    engine = _paddle_engine() if backend == "paddle" else None
+    if engine is None:
+        backend = "tesseract"
+        if not OCR_AVAILABLE or pytesseract is None:
+            # Если нет poppler/pdf2image или pytesseract, OCR недоступен.
             return ""
-        return pytesseract.image_to_string(imgs[0], lang=lang) or ""
+    if convert_from_path is None:
+        return ""
+    key = _ocr_cache_key(pdf_path, pidx, dpi, lang, config, backend, binarize, crop)
+    cached = _cached_ocr_text(key)
+    if cached is not None:
+        return cached
+    try:
+        if image is None:
+            # convert_from_path рендерит страницу PDF в изображение, которое
+            # затем передаётся в pytesseract для распознавания. Цвет для OCR
+            # не нужен: Tesseract всё равно переводит страницу в оттенки
+            # серого, а серое изображение втрое меньше при передаче и чтении.
+            imgs = convert_from_path(
+                str(pdf_path),
+                dpi=dpi,
+                first_page=pidx + 1,
+                last_page=pidx + 1,
+                grayscale=True,
+                **_poppler_kwargs(),
+            )
+            image = imgs[0] if imgs else None
+        if image is not None:
+            image = _prepare_ocr_image(image, binarize, crop)
+        if image is None:
+            text = ""
+        elif engine is not None:
+            text = _paddle_image_to_string(engine, image)
+        else:
+            text = pytesseract.image_to_string(image, lang=lang, config=config) or ""
     except Exception:
         # Ошибки рендеринга/распознавания не критичны — просто возвращаем
-        # пустой текст, чтобы алгоритм попробовал другой способ.
+        # пустой текст, чтобы алгоритм попробовал другой способ. Результат не
+        # кэшируем: сбой мог быть временным.
         return ""
+    _store_ocr_text(key, text)
+    return text
+
+
+def _catalog_page_count(doc) -> Optional[int]:
+    """Читает число страниц из /Count корня дерева страниц или возвращает None."""
+
+    try:
+        pages = resolve1(doc.catalog["Pages"])
+        count = resolve1(pages["Count"])
+    except Exception:
+        return None
+    if isinstance(count, int) and count > 0:
+        return count
+    return None
 
 
 def get_page_count(pdf_path: Path) -> int:
     """Определяет количество страниц PDF с fallback'ами."""
 
-    if _pdfminer_available and PDFParser and PDFDocument and PDFPage:
+    if fitz is not None or (_pdfminer_available and PDFParser and PDFDocument and PDFPage):
+        # Внутри process_pdf документ уже открыт: xref и каталог разбираются
+        # один раз и для подсчёта страниц, и для извлечения текста.
+        doc = _current_document(pdf_path)
+        owned = doc is None
+        if owned:
+            doc = _PdfDocument(pdf_path)
         try:
-            with open(pdf_path, "rb") as f:
-                parser = PDFParser(f)
-                doc = PDFDocument(parser)
-                # Перебираем все страницы, чтобы узнать их число. PDFPage сам
-                # обрабатывает внутренние структуры документа.
-                return sum(1 for _ in PDFPage.create_pages(doc))
+            return doc.page_count()
         except Exception:
-            # Если pdfminer не справился, пробуем запасной путь.
+            # Если ни PyMuPDF, ни pdfminer не справились, пробуем запасной путь.
             pass
+        finally:
+            if owned:
+                doc.close()
     if convert_from_path is not None:
         try:
             # pdf2image не возвращает количество страниц, но если рендер
@@ -201,6 +882,44 @@ def get_page_count(pdf_path: Path) -> int:
     return 1
 
 
+def _should_cancel(cancel_file: Optional[Union[str, os.PathLike]]) -> bool:
+    """Возвращает True, если существует файл отмены."""
+
+    if not cancel_file:
+        return False
+    try:
+        return Path(cancel_file).exists()
+    except Exception:
+        return False
+
+
+# Как часто проверять файл отмены. Четверть секунды незаметна пользователю, но
+# избавляет от stat() на каждой странице и каждом результате пула.
+_CANCEL_CHECK_INTERVAL = 0.25
+
+
+def _cancel_checker(
+    cancel_file: Optional[Union[str, os.PathLike]], interval: float = _CANCEL_CHECK_INTERVAL
+) -> Callable[[], bool]:
+    """Возвращает проверку файла отмены, которая обращается к диску не чаще interval секунд."""
+
+    if not cancel_file:
+        return lambda: False
+    last_check = [float("-inf"), False]
+
+    def _check() -> bool:
+        # Однажды запрошенная отмена не снимается, поэтому файл больше не проверяем.
+        if last_check[1]:
+            return True
+        now = time.monotonic()
+        if now - last_check[0] >= interval:
+            last_check[0] = now
+            last_check[1] = _should_cancel(cancel_file)
+        return last_check[1]
+
+    return _check
+
+
 def _coerce_cancel_callback(
     cancel_cb: Optional[Union[Callable[[], bool], str, os.PathLike]]
 ) -> Optional[Callable[[], bool]]:
@@ -210,28 +929,23 @@ def _coerce_cancel_callback(
         return None
     if callable(cancel_cb):
         return cancel_cb
-    path = Path(cancel_cb)
+    # Для совместимости с GUI: отмена считается запрошенной, если появляется
+    # файл-флаг, созданный интерфейсом.
+    return _cancel_checker(cancel_cb)
 
-    def _check() -> bool:
-        try:
-            # Для совместимости с GUI: отмена считается запрошенной, если
-            # появляется файл-флаг, созданный интерфейсом.
-            return path.exists()
-        except Exception:
-            return False
-
-    return _check
 
-
-def _dump_debug_text(pdf_path: Path, page_idx: int, kind: str, text: str) -> None:
+def _dump_debug_text(
+    pdf_path: Path, page_idx: int, kind: str, text: str, dump_dir: Optional[str] = None
+) -> None:
     """Сохраняет распознанный текст на диск для последующей отладки."""
 
-    if not DEBUG_DUMP_DIR or not text:
+    dump_dir = dump_dir or DEBUG_DUMP_DIR
+    if not dump_dir or not text:
         return
     try:
-        base = Path(DEBUG_DUMP_DIR)
+        base = Path(dump_dir)
         base.mkdir(parents=True, exist_ok=True)
-        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", pdf_path.stem)
+        safe_name = _UNSAFE_NAME_RE.sub("_", pdf_path.stem)
         out = base / f"{safe_name}_p{page_idx + 1}_{kind}_{os.getpid()}.txt"
         with open(out, "w", encoding="utf-8") as fh:
             fh.write(text)
@@ -240,31 +954,37 @@ def _dump_debug_text(pdf_path: Path, page_idx: int, kind: str, text: str) -> Non
         logger.debug("Failed to dump debug text for %s page %s", pdf_path, page_idx + 1, exc_info=True)
 
 
-def _should_cancel(cancel_file: Optional[Union[str, os.PathLike]]) -> bool:
-    """Возвращает True, если существует файл отмены."""
+def _init_process_worker(log_path: Optional[str], cache_path: Optional[str] = None) -> None:
+    """Переносит настройки логирования и кэша CLI в дочерний процесс пула."""
 
-    if not cancel_file:
-        return False
-    try:
-        return Path(cancel_file).exists()
-    except Exception:
-        return False
+    _configure_disk_cache(cache_path)
+    # При fork обработчики логирования наследуются от родителя, при spawn —
+    # нет; настраиваем файл лога только во втором случае, чтобы не дублировать строки.
+    if log_path and not logging.getLogger().handlers:
+        _configure_logging(log_path)
 
 
-def process_pdf_files(
+def iter_pdf_results(
     pdfs: List[Path],
     workers: int,
     process_kwargs: Dict[str, object],
     cancel_file: Optional[Union[str, os.PathLike]] = None,
     progress_cb: Optional[Callable[[Dict[str, Optional[str]]], None]] = None,
-) -> List[Dict[str, Optional[str]]]:
-    """Обрабатывает список PDF-файлов последовательно или в пуле потоков."""
+    executor: str = "thread",
+) -> Iterator[Dict[str, Optional[str]]]:
+    """Обрабатывает PDF-файлы и отдаёт результаты по мере готовности в исходном порядке.
+
+    ``executor="process"`` запускает файлы в ``ProcessPoolExecutor``: pdfminer и
+    поиск по регулярным выражениям держат GIL, поэтому только процессы
+    загружают все ядра. ``cancel_cb`` в ``process_kwargs`` должен быть путём к
+    файлу отмены — замыкания не передаются между процессами.
+    """
 
     if not pdfs:
-        return []
-    if _should_cancel(cancel_file):
-        return []
-    results: Dict[int, Dict[str, Optional[str]]] = {}
+        return
+    is_canceled = _cancel_checker(cancel_file)
+    if is_canceled():
+        return
     max_workers = workers if isinstance(workers, int) else 1
     if max_workers <= 0:
         # Значение 0 используется как "авто" — равное количеству CPU.
@@ -273,9 +993,8 @@ def process_pdf_files(
     # Нет смысла создавать потоков больше, чем файлов.
     max_workers = min(max_workers, len(pdfs))
 
-    def _handle_result(idx: int, record: Dict[str, Optional[str]]):
-        # Сохраняем результат под исходным индексом и уведомляем GUI о прогрессе.
-        results[idx] = record
+    def _notify(record: Dict[str, Optional[str]]):
+        # Уведомляем GUI о прогрессе сразу по завершении файла.
         if progress_cb:
             try:
                 progress_cb(record)
@@ -285,120 +1004,197 @@ def process_pdf_files(
     if max_workers == 1:
         # Последовательная обработка используется по умолчанию — предсказуемо
         # и не требует потоков.
-        for idx, pdf in enumerate(pdfs):
-            if _should_cancel(cancel_file):
+        for pdf in pdfs:
+            if is_canceled():
                 break
             try:
                 rec = process_pdf(pdf, **process_kwargs)
             except Exception:
                 logger.exception("Failed to process %s", pdf)
                 rec = {"source": pdf.name, "track": None, "code": None, "method": "error"}
-            _handle_result(idx, rec)
+            _notify(rec)
+            yield rec
             if rec.get("method") == "canceled":
                 break
-    else:
-        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
-        futures: Dict[concurrent.futures.Future, int] = {}
-        try:
-            for idx, pdf in enumerate(pdfs):
-                if _should_cancel(cancel_file):
-                    break
-                # Запускаем обработку файла в отдельном рабочем потоке.
-                future = executor.submit(process_pdf, pdf, **process_kwargs)
-                futures[future] = idx
-            for future in concurrent.futures.as_completed(futures):
-                idx = futures[future]
-                try:
-                    rec = future.result()
-                except Exception:
-                    logger.exception("Failed to process %s", pdfs[idx])
-                    rec = {"source": pdfs[idx].name, "track": None, "code": None, "method": "error"}
-                _handle_result(idx, rec)
-                if rec.get("method") == "canceled" or _should_cancel(cancel_file):
-                    break
-        finally:
-            executor.shutdown(wait=False, cancel_futures=True)
+        return
 
-    ordered = [results[idx] for idx in sorted(results)]
-    return ordered
+    if executor == "process":
+        pool: concurrent.futures.Executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_process_worker,
+            initargs=(LOG_PATH, OCR_CACHE_PATH),
+        )
+    else:
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    futures: Dict[concurrent.futures.Future, int] = {}
+    # Файлы завершаются в произвольном порядке; готовые результаты ждут в
+    # буфере, пока не будут отданы все предыдущие по списку.
+    pending: Dict[int, Dict[str, Optional[str]]] = {}
+    next_idx = 0
+    try:
+        for idx, pdf in enumerate(pdfs):
+            if is_canceled():
+                break
+            # Запускаем обработку файла в отдельном потоке или процессе.
+            future = pool.submit(process_pdf, pdf, **process_kwargs)
+            futures[future] = idx
+        for future in concurrent.futures.as_completed(futures):
+            idx = futures[future]
+            try:
+                rec = future.result()
+            except Exception:
+                logger.exception("Failed to process %s", pdfs[idx])
+                rec = {"source": pdfs[idx].name, "track": None, "code": None, "method": "error"}
+            _notify(rec)
+            pending[idx] = rec
+            while next_idx in pending:
+                yield pending.pop(next_idx)
+                next_idx += 1
+            if rec.get("method") == "canceled" or is_canceled():
+                break
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    # После отмены часть файлов не обработана; отдаём то, что успело завершиться.
+    for idx in sorted(pending):
+        yield pending[idx]
 
 
-def _extract_line_context(text: str, start: int, end: int) -> Tuple[str, str, str]:
-    """Возвращает строку со сработавшим совпадением и соседние строки."""
-    line_start = text.rfind("\n", 0, start)
-    if line_start == -1:
-        line_start = 0
-    else:
-        line_start += 1
-    line_end = text.find("\n", end)
-    if line_end == -1:
-        line_end = len(text)
-    line_text = text[line_start:line_end]
-
-    prev_line = ""
-    if line_start > 0:
-        prev_end = line_start - 1
-        prev_start = text.rfind("\n", 0, prev_end)
-        if prev_start == -1:
-            prev_start = 0
-        else:
-            prev_start += 1
-        prev_line = text[prev_start:prev_end]
+def process_pdf_files(
+    pdfs: List[Path],
+    workers: int,
+    process_kwargs: Dict[str, object],
+    cancel_file: Optional[Union[str, os.PathLike]] = None,
+    progress_cb: Optional[Callable[[Dict[str, Optional[str]]], None]] = None,
+    executor: str = "thread",
+) -> List[Dict[str, Optional[str]]]:
+    """Обрабатывает список PDF-файлов и возвращает результаты в исходном порядке."""
+
+    return list(
+        iter_pdf_results(
+            pdfs,
+            workers=workers,
+            process_kwargs=process_kwargs,
+            cancel_file=cancel_file,
+            progress_cb=progress_cb,
+            executor=executor,
+        )
+    )
 
-    next_line = ""
-    if line_end < len(text):
-        next_start = line_end + 1
-        next_end = text.find("\n", next_start)
-        if next_end == -1:
-            next_end = len(text)
-        next_line = text[next_start:next_end]
 
+def _newline_offsets(text: str) -> List[int]:
+    """Возвращает позиции переводов строк с границами -1 и len(text) по краям."""
+
+    offsets = [-1]
+    pos = text.find("\n")
+    while pos != -1:
+        offsets.append(pos)
+        pos = text.find("\n", pos + 1)
+    offsets.append(len(text))
+    return offsets
+
+
+def _extract_line_context(
+    text: str, start: int, end: int, newlines: Optional[List[int]] = None
+) -> Tuple[str, str, str]:
+    """Возвращает строку со сработавшим совпадением и соседние строки.
+
+    ``newlines`` — результат ``_newline_offsets(text)``; если его передать,
+    границы строк находятся двоичным поиском, без просмотра текста назад.
+    """
+    if newlines is None:
+        newlines = _newline_offsets(text)
+    # i — последний перевод строки до совпадения, j — первый после его конца.
+    i = bisect_left(newlines, start) - 1
+    j = bisect_left(newlines, end)
+    line_text = text[newlines[i] + 1:newlines[j]]
+    prev_line = text[newlines[i - 1] + 1:newlines[i]] if i > 0 else ""
+    next_line = text[newlines[j] + 1:newlines[j + 1]] if j + 1 < len(newlines) else ""
     return line_text, prev_line, next_line
 
 
+def _match_spans(pattern: re.Pattern, text: str) -> Tuple[List[int], List[int]]:
+    """Возвращает начала и концы всех совпадений шаблона в тексте."""
+
+    starts: List[int] = []
+    ends: List[int] = []
+    for m in pattern.finditer(text):
+        starts.append(m.start())
+        ends.append(m.end())
+    return starts, ends
+
+
+def _has_span_within(spans: Tuple[List[int], List[int]], lo: int, hi: int) -> bool:
+    """Проверяет, есть ли совпадение, целиком лежащее в [lo, hi]."""
+
+    # Совпадения finditer не пересекаются, поэтому концы отсортированы так же,
+    # как начала: достаточно проверить первое совпадение, начавшееся не раньше lo.
+    starts, ends = spans
+    i = bisect_left(starts, lo)
+    return i < len(starts) and ends[i] <= hi
+
+
+def _is_number_fragment(segment: str, start: int, end: int) -> bool:
+    """Проверяет, продолжается ли число segment[start:end] цифрами на той же строке."""
+
+    return bool(
+        _DIGIT_AFTER_RE.match(segment, end)
+        or _DIGIT_BEFORE_RE.search(segment, max(0, start - 9), start)
+    )
+
+
 def _match_after_label(
     segment: str,
     start_idx: int,
     seq_re: re.Pattern,
-    expected_len: int,
     base_score: int,
 ) -> Optional[_NumberCandidate]:
     """Ищет числовую последовательность после найденного текстового ярлыка."""
 
-    window = segment[start_idx:start_idx + 500]
-    m = seq_re.search(window)
+    # Ищем прямо в сегменте с границами pos/endpos — без копии окна в 500
+    # символов на каждую подпись. В шаблонах последовательностей нет якорей,
+    # поэтому результат тот же, что и при поиске в срезе.
+    m = seq_re.search(segment, start_idx, start_idx + 500)
     if not m:
         return None
-    digits = re.sub(r"\D", "", m.group())
-    if len(digits) != expected_len:
-        return None
-    if expected_len == 14 and not re.fullmatch(TRACK14, digits):
-        return None
-    return _NumberCandidate(digits, start_idx + m.start(), start_idx + m.end(), base_score)
+    return _NumberCandidate(m.group().translate(_SEPARATOR_DELETE), m.start(), m.end(), base_score)
 
 
 def _dedup_candidates(candidates: List[_NumberCandidate]) -> List[_NumberCandidate]:
     """Удаляет дубликаты кандидатов, сохраняя самых релевантных."""
 
-    ordered = sorted(candidates, key=lambda c: (-c.score, c.start, c.end, c.value))
-    seen = set()
-    result: List[_NumberCandidate] = []
-    for cand in ordered:
+    if len(candidates) < 2:
+        return candidates
+    # Для каждой позиции оставляем кандидата с наибольшим баллом; сортируется
+    # уже только список без дубликатов.
+    best: Dict[Tuple[str, int, int], _NumberCandidate] = {}
+    for cand in candidates:
         key = (cand.value, cand.start, cand.end)
-        if key in seen:
-            continue
-        seen.add(key)
-        result.append(cand)
-    return result
+        cur = best.get(key)
+        if cur is None or cand.score > cur.score:
+            best[key] = cand
+    return sorted(best.values(), key=lambda c: (-c.score, c.start, c.end, c.value))
 
 
 def _choose_best_pair(tracks: List[_NumberCandidate], codes: List[_NumberCandidate]):
     """Подбирает пару "трек + код", расположенную близко друг к другу."""
 
+    if not tracks or not codes:
+        return None
+    # Коды упорядочиваем по началу и для каждого трека двоичным поиском берём
+    # только те, что могут лежать ближе 350 символов: остальные пары всё равно
+    # отбрасывались бы проверкой расстояния.
+    order = sorted(range(len(codes)), key=lambda i: codes[i].start)
+    starts = [codes[i].start for i in order]
+    max_len = max(c.end - c.start for c in codes)
+
     best_pair = None
     best_key = (-1, -1, -1)
-    for t in tracks:
-        for c in codes:
+    best_idx = (-1, -1)
+    for ti, t in enumerate(tracks):
+        lo = bisect_left(starts, t.start - 350 - max_len)
+        hi = bisect_right(starts, t.end + 350)
+        for ci in order[lo:hi]:
+            c = codes[ci]
             if c.start < t.end and c.end > t.start:
                 continue
             if c.start >= t.end:
@@ -409,8 +1205,13 @@ def _choose_best_pair(tracks: List[_NumberCandidate], codes: List[_NumberCandida
                 continue
             order_bonus = 1 if t.start <= c.start else 0
             score_key = (t.score + c.score, order_bonus, -gap)
-            if score_key > best_key:
+            # При равенстве побеждает пара, встреченная раньше при переборе
+            # в исходном порядке кандидатов.
+            if score_key > best_key or (
+                score_key == best_key and best_idx[0] == ti and ci < best_idx[1]
+            ):
                 best_key = score_key
+                best_idx = (ti, ci)
                 best_pair = (t.value, c.value)
     return best_pair
 
@@ -418,19 +1219,36 @@ def _choose_best_pair(tracks: List[_NumberCandidate], codes: List[_NumberCandida
 def sniff_track_code_with_labels(text: str):
     """Ищет в тексте PDF трек-номер и код получения, анализируя подписи."""
 
-    # Неразрывные пробелы заменяем на обычные, чтобы регулярные выражения
-    # находили совпадения без дополнительных условий.
-    t = text.replace("\xa0", " ").replace("\u202f", " ")
+    # Неразрывные пробелы и типографские дефисы приводим к обычным, чтобы
+    # регулярные выражения находили совпадения без дополнительных условий.
+    t = text.translate(_NORM_TABLE)
+    # Любой кандидат — и трек, и код — содержит совпадение CODE_SEQ_RE (трек
+    # из 14 цифр включает восемь подряд). Если его нет, дальнейшие проходы
+    # заведомо ничего не найдут; на страницах без номеров поиск обрывается
+    # после одного прохода по тексту.
+    if CODE_SEQ_RE.search(t) is None:
+        return None, None
 
     segments = []
     logo_matches = list(LOGO_RE.finditer(t))
     if logo_matches:
         # На уведомлениях Почты логотип часто расположен в начале; текст после
         # него содержит полезные данные, поэтому анализируем этот "хвост" отдельно.
-        tail = t[logo_matches[-1].end():]
+        logo = logo_matches[-1]
+        tail = t[logo.end():]
         if tail.strip():
             segments.append(tail)
-    segments.append(t)
+    # Если перед логотипом только пробелы, полный текст отличается от «хвоста»
+    # лишь самим логотипом: в нём нет ни цифр, ни подписей, и второй проход
+    # дал бы тех же кандидатов. Хвост, начинающийся с буквы или цифры,
+    # проверяем полностью — у границы логотипа иначе срабатывает \b.
+    tail_only = (
+        bool(segments)
+        and not t[: logo.start()].strip()
+        and not (tail[0].isalnum() or tail[0] == "_")
+    )
+    if not tail_only:
+        segments.append(t)
 
     best_track = None
     best_code = None
@@ -443,47 +1261,78 @@ def sniff_track_code_with_labels(text: str):
         track_candidates: List[_NumberCandidate] = []
         code_candidates: List[_NumberCandidate] = []
         track_spans: List[Tuple[int, int]] = []
+        track_label_spans: Tuple[List[int], List[int]] = ([], [])
+        # Коды, стоящие непосредственно после своей подписи.
+        label_codes: List[_NumberCandidate] = []
 
         # Сперва пытаемся найти числа сразу после слов "трек", "идентификатор" и т.п.
-        for match in TRACK_LABEL_RE.finditer(segment):
-            cand = _match_after_label(segment, match.end(), TRACK_SEQ_RE, 14, 4)
-            if cand:
-                track_candidates.append(cand)
-                track_spans.append((cand.start, cand.end))
-
-        for match in CODE_LABEL_RE.finditer(segment):
-            cand = _match_after_label(segment, match.end(), CODE_SEQ_RE, 8, 4)
-            if cand:
-                code_candidates.append(cand)
+        # Подписи обоих типов собираем за один проход; позиции подписей трека
+        # запоминаем, чтобы ниже оценивать контекст без повторного поиска.
+        for match in _LABEL_RE.finditer(segment):
+            if match.group("track") is not None:
+                track_label_spans[0].append(match.start())
+                track_label_spans[1].append(match.end())
+                cand = _match_after_label(segment, match.end(), TRACK_SEQ_RE, 4)
+                if cand:
+                    track_candidates.append(cand)
+                    track_spans.append((cand.start, cand.end))
+            else:
+                cand = _match_after_label(segment, match.end(), CODE_SEQ_RE, 4)
+                if cand:
+                    code_candidates.append(cand)
+                    if _LABEL_GAP_RE.fullmatch(segment, match.end(), cand.start):
+                        label_codes.append(cand)
+
+        # Трек и код, стоящие сразу после своих подписей, — обычный случай для
+        # уведомлений Почты. Такую пару возвращаем сразу: поиск чисел без
+        # подписей дорог и лишь добавляет конкурентов вроде номеров заказов
+        # и ИНН рядом со словом «код». Подпись без числа (код стоит над ней)
+        # находит первое число ниже по тексту — номер заказа, начало трека,
+        # телефона или ИНН. Такие коды и части длинных чисел в быструю пару не
+        # берём: их оценит полный проход ниже.
+        label_codes = [
+            cand
+            for cand in label_codes
+            if not any(cand.start < te and cand.end > ts for ts, te in track_spans)
+            and not _is_number_fragment(segment, cand.start, cand.end)
+        ]
+        if track_candidates and label_codes:
+            pair = _choose_best_pair(track_candidates, label_codes)
+            if pair:
+                return pair
+
+        # Позиции контекстных слов находим один раз на сегмент; проверка окна
+        # ±80 символов вокруг кандидата — двоичный поиск без среза строки.
+        track_context_spans = _match_spans(TRACK_CONTEXT_RE, segment)
+        code_context_spans = _match_spans(CODE_CONTEXT_RE, segment)
+        # Переводы строк ищем один раз и только если дойдёт до кандидатов кода.
+        newlines: Optional[List[int]] = None
 
         # Дополнительно ищем последовательности цифр подходящего формата — они
         # могут встретиться без явных подписей.
         for match in TRACK_SEQ_RE.finditer(segment):
-            digits = re.sub(r"\D", "", match.group())
-            if not re.fullmatch(TRACK14, digits):
-                continue
+            digits = match.group().translate(_SEPARATOR_DELETE)
             start, end = match.start(), match.end()
-            context = segment[max(0, start - 80):min(len(segment), end + 80)]
+            lo, hi = max(0, start - 80), min(len(segment), end + 80)
             score = 1
-            if TRACK_LABEL_RE.search(context):
+            if _has_span_within(track_label_spans, lo, hi):
                 score = 4
-            elif TRACK_CONTEXT_RE.search(context):
+            elif _has_span_within(track_context_spans, lo, hi):
                 score = 2
             track_candidates.append(_NumberCandidate(digits, start, end, score))
             track_spans.append((start, end))
 
         for match in CODE_SEQ_RE.finditer(segment):
-            digits = re.sub(r"\D", "", match.group())
-            if len(digits) != 8:
-                continue
+            digits = match.group().translate(_SEPARATOR_DELETE)
             start, end = match.start(), match.end()
             # Исключаем числа, попавшие внутрь трек-номера (OCR может разбить его на части).
             if any(start >= ts and end <= te for ts, te in track_spans):
                 continue
-            context = segment[max(0, start - 80):min(len(segment), end + 80)]
-            if not CODE_CONTEXT_RE.search(context):
+            if not _has_span_within(code_context_spans, start - 80, end + 80):
                 continue
-            line_text, prev_line, next_line = _extract_line_context(segment, start, end)
+            if newlines is None:
+                newlines = _newline_offsets(segment)
+            line_text, prev_line, next_line = _extract_line_context(segment, start, end, newlines)
             line_has_code_kw = bool(CODE_CONTEXT_RE.search(line_text))
             nearby_code_kw = line_has_code_kw or bool(CODE_CONTEXT_RE.search(prev_line)) or bool(CODE_CONTEXT_RE.search(next_line))
             if not nearby_code_kw:
@@ -494,7 +1343,7 @@ def sniff_track_code_with_labels(text: str):
             if CODE_LABEL_RE.search(line_text) or CODE_LABEL_RE.search(prev_line):
                 score = 5
             elif CODE_LABEL_RE.search(next_line):
-                clean_line = re.sub(r"[\s\u00a0-]", "", line_text)
+                clean_line = line_text.translate(_SEPARATOR_DELETE)
                 if clean_line.isdigit() and clean_line == digits:
                     score = max(score, 5)
                 else:
@@ -522,6 +1371,26 @@ def sniff_track_code_with_labels(text: str):
     return best_track, best_code
 
 
+# Результаты разбора текста: повторная обработка того же PDF и совпадающие тексты
+# слоя и OCR не прогоняются через регулярные выражения заново. Ключ — дайджест
+# текста, чтобы не держать в кэше сами длинные строки.
+_SNIFF_CACHE = _LRUCache(maxsize=1024)
+
+
+def _sniff_cached(text: str):
+    """Вызывает sniff_track_code_with_labels, запоминая результат по тексту."""
+
+    sniff = sniff_track_code_with_labels
+    # Функция входит в ключ: подменённый анализатор не получит чужих результатов.
+    key = (sniff, hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest())
+    cached = _SNIFF_CACHE.get(key)
+    if cached is not None:
+        return cached
+    result = sniff(text)
+    _SNIFF_CACHE.put(key, result)
+    return result
+
+
 def process_pdf(
     pdf_path: Path,
     max_pages_back=5,
@@ -531,61 +1400,208 @@ def process_pdf(
     force_ocr=False,
     ocr_dpi=300,
     ocr_lang="rus+eng",
+    ocr_config="",
+    ocr_fast_dpi=200,
+    debug_dump_dir=None,
+    ocr_page_workers=1,
+    ocr_batch=False,
+    ocr_backend="tesseract",
+    ocr_crop=False,
 ) -> Dict[str, Optional[str]]:
-    """Обрабатывает один PDF и пытается извлечь из него трек и код."""
+    """Обрабатывает один PDF и пытается извлечь из него трек и код.
+
+    ``debug_dump_dir`` передаётся явно, а не через глобальную переменную, чтобы
+    настройка доходила до процессов пула при любом способе их запуска.
+    """
 
     res = {"source": pdf_path.name, "track": None, "code": None, "method": ""}
     cancel_fn = _coerce_cancel_callback(cancel_cb)
     ocr_threshold = max(0, int(min_chars_for_ocr or 0))
-    total_pages = max(1, get_page_count(pdf_path))
-    # Бежим по страницам в обратном порядке: в уведомлениях нужные данные
-    # обычно находятся ближе к концу документа.
-    pages = list(range(total_pages - 1, -1, -1))
-    if max_pages_back > 0:
-        pages = pages[:max_pages_back]
-
-    for pidx in pages:
-        if cancel_fn and cancel_fn():
-            res["method"] = "canceled"
-            return res
-        tr = cd = None
-        txt = ""
-        method = ""
+    page_texts: Dict[int, str] = {}
+    # Трек, найденный в текстовом слое без кода, и страница, где он найден:
+    # штрихкод обычно есть в слое, а блок с кодом бывает картинкой.
+    text_track: Optional[str] = None
+    text_track_page: Optional[int] = None
+    # Документ открывается один раз и для подсчёта страниц, и для всего
+    # текстового прохода, а не заново на каждую страницу.
+    with _pdf_document_scope(pdf_path):
+        total_pages = max(1, get_page_count(pdf_path))
+        # Бежим по страницам в обратном порядке: в уведомлениях нужные данные
+        # обычно находятся ближе к концу документа. Срез range остаётся ленивым
+        # объектом range: список номеров всех страниц не строится, а сам
+        # диапазон можно обойти повторно во втором проходе.
+        pages = range(total_pages - 1, -1, -1)
+        if max_pages_back > 0:
+            pages = pages[:max_pages_back]
+
+        # Первый проход — только текстовый слой по всем выбранным страницам:
+        # OCR на порядки дороже, и одна страница с текстом избавляет от
+        # распознавания всех остальных.
         if not force_ocr:
-            txt = extract_page_text_pdfminer(pdf_path, pidx)
-            if txt:
-                _dump_debug_text(pdf_path, pidx, "text", txt)
-            tr, cd = sniff_track_code_with_labels(txt)
-            if tr and cd:
-                method = "text"
-        need_ocr = False
-        if enable_ocr:
-            # OCR включается либо по требованию пользователя (force_ocr), либо
-            # если текстового слоя недостаточно для уверенного поиска.
-            if force_ocr:
-                need_ocr = True
-            elif (not tr or not cd) and len(txt) < ocr_threshold:
-                need_ocr = True
-        if need_ocr:
-            ocr_txt = extract_page_text_ocr(pdf_path, pidx, dpi=ocr_dpi, lang=ocr_lang)
-            if ocr_txt:
-                _dump_debug_text(pdf_path, pidx, "ocr", ocr_txt)
-                tr2, cd2 = sniff_track_code_with_labels(ocr_txt)
-                if tr2 and cd2:
-                    tr, cd = tr2, cd2
-                    method = "ocr"
-        if tr and cd:
-            res.update(track=tr, code=cd, method=method)
-            return res
+            for pidx in pages:
+                if cancel_fn and cancel_fn():
+                    res["method"] = "canceled"
+                    return res
+                txt = extract_page_text_pdfminer(pdf_path, pidx)
+                page_texts[pidx] = txt
+                if txt:
+                    _dump_debug_text(pdf_path, pidx, "text", txt, debug_dump_dir)
+                tr, cd = _sniff_cached(txt)
+                if tr and cd:
+                    res.update(track=tr, code=cd, method="text")
+                    return res
+                if tr and text_track is None:
+                    text_track, text_track_page = tr, pidx
+            # Трек и код могут оказаться на разных страницах (например, код
+            # перенесён на следующую). Прежде чем запускать OCR, ищем по
+            # склеенному в порядке документа тексту всех прочитанных страниц.
+            if len(page_texts) > 1:
+                joined = "\n".join(page_texts[pidx] for pidx in sorted(page_texts))
+                tr, cd = _sniff_cached(joined)
+                if tr and cd:
+                    res.update(track=tr, code=cd, method="text")
+                    return res
+
+    if not enable_ocr:
+        return res
+    # Второй проход — OCR. Он включается либо по требованию пользователя
+    # (force_ocr), либо для страниц, где текстового слоя недостаточно для
+    # уверенного поиска.
+    # Страница с треком из текстового слоя распознаётся, даже если текста на
+    # ней достаточно: код на ней может быть только изображением. Пробелы и
+    # переводы строк не считаются: у сканов слой бывает заполнен только ими.
+    ocr_pages = [
+        pidx
+        for pidx in pages
+        if force_ocr
+        or pidx == text_track_page
+        or len(page_texts.get(pidx, "").strip()) < ocr_threshold
+    ]
+    # Сначала распознаём на пониженном DPI: время рендера и Tesseract растёт
+    # как квадрат DPI, а подписи и номера обычно читаются и на 200. Быстрый
+    # проход дополнительно бинаризует страницы (и при ocr_crop обрезает их до
+    # полос с подписями). Последний проход всегда получает исходную страницу
+    # целиком на полном DPI — он нужен только тем файлам, где предыдущие
+    # ничего не нашли. Элементы списка: (dpi, binarize, crop, config).
+    # Предварительные проходы запускают Tesseract с --psm 6: без анализа
+    # разметки он быстрее и читает подпись и номер одной строкой; если
+    # пользователь задал --psm сам, его настройка сохраняется.
+    fast_config = ocr_config if "--psm" in ocr_config else f"{ocr_config} --psm 6".strip()
+    # Если трек уже известен из слоя, не хватает только кода: быстрый проход
+    # распознаёт лишь полосы с подписями, без штрихкода, который сбивает
+    # Tesseract.
+    crop_first = ocr_crop or text_track is not None
+    ocr_passes = [(ocr_dpi, False, False, ocr_config)]
+    if ocr_fast_dpi and 0 < ocr_fast_dpi < ocr_dpi:
+        ocr_passes.insert(0, (ocr_fast_dpi, True, crop_first, fast_config))
+    elif crop_first:
+        ocr_passes.insert(0, (ocr_dpi, False, True, fast_config))
+    # Если PaddleOCR не загрузился, extract_page_text_ocr распознаёт и кэширует
+    # страницы под ключом Tesseract. Тот же движок учитываем здесь: иначе
+    # проверка кэша перед рендером промахивается, а пакетный режим не включается.
+    if ocr_backend == "paddle" and ocr_pages and _paddle_engine() is None:
+        ocr_backend = "tesseract"
+    page_pool = None
+    if ocr_page_workers > 1 and len(ocr_pages) > 1:
+        page_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(ocr_page_workers, len(ocr_pages))
+        )
+    try:
+        # Страницы рендерятся и распознаются порциями: в памяти одновременно
+        # лежит не больше порции изображений, а если пара нашлась на первых
+        # страницах, остальные не рендерятся вовсе. Порции хватает, чтобы
+        # занять все потоки --ocr-page-workers.
+        chunk_size = max(2, ocr_page_workers)
+        for pass_idx, (dpi, binarize, crop, config) in enumerate(ocr_passes):
+            ocr_kwargs = {
+                "dpi": dpi,
+                "lang": ocr_lang,
+                "config": config,
+                "binarize": binarize,
+                "crop": crop,
+            }
+            if ocr_backend != "tesseract":
+                ocr_kwargs["backend"] = ocr_backend
+            for chunk_start in range(0, len(ocr_pages), chunk_size):
+                chunk = ocr_pages[chunk_start : chunk_start + chunk_size]
+                # Страницы порции, которых нет в кэше OCR, рендерим заранее одним
+                # вызовом Poppler.
+                to_render = []
+                for pidx in chunk:
+                    key = _ocr_cache_key(pdf_path, pidx, dpi, ocr_lang, config, ocr_backend, binarize, crop)
+                    if _cached_ocr_text(key) is None:
+                        to_render.append(pidx)
+                images = render_pages_for_ocr(pdf_path, to_render, dpi=dpi) if len(to_render) > 1 else {}
+                if ocr_backend == "tesseract" and ocr_batch and images:
+                    # Пакетный режим распознаёт всю порцию сразу и заполняет
+                    # кэш; цикл ниже берёт тексты оттуда. Tesseract запускается
+                    # один раз на порцию, а не на каждую страницу.
+                    for pidx in ocr_pages_batch(pdf_path, images, **ocr_kwargs):
+                        images.pop(pidx, None)
+                futures: Dict[int, concurrent.futures.Future] = {}
+                if page_pool is not None:
+                    # Tesseract работает во внешнем процессе и не держит GIL, поэтому
+                    # страницы распознаются параллельно. Результаты разбираем в
+                    # исходном порядке: выбор страницы не зависит от того, какая
+                    # закончилась раньше.
+                    for pidx in chunk:
+                        futures[pidx] = page_pool.submit(
+                            extract_page_text_ocr, pdf_path, pidx, image=images.pop(pidx, None), **ocr_kwargs
+                        )
+                for pidx in chunk:
+                    if cancel_fn and cancel_fn():
+                        res["method"] = "canceled"
+                        return res
+                    if pidx in futures:
+                        ocr_txt = futures[pidx].result()
+                    else:
+                        ocr_txt = extract_page_text_ocr(
+                            pdf_path, pidx, image=images.pop(pidx, None), **ocr_kwargs
+                        )
+                    if not ocr_txt:
+                        continue
+                    kind = "ocr" if pass_idx == len(ocr_passes) - 1 else "ocr_fast"
+                    _dump_debug_text(pdf_path, pidx, kind, ocr_txt, debug_dump_dir)
+                    tr, cd = _sniff_cached(ocr_txt)
+                    if tr and cd:
+                        res.update(track=tr, code=cd, method="ocr")
+                        return res
+                    if cd and text_track:
+                        # Из OCR берём только код; трек надёжнее в текстовом слое.
+                        res.update(track=text_track, code=cd, method="text+ocr")
+                        return res
+    finally:
+        if page_pool is not None:
+            # Остальные страницы больше не нужны: не ждём их и снимаем с очереди.
+            page_pool.shutdown(wait=False, cancel_futures=True)
     return res
 
 
-def walk_pdfs(path: Path):
+def walk_pdfs(path: Path) -> List[Path]:
     """Возвращает список PDF-файлов: одиночный файл или все из каталога."""
 
     if path.is_file() and path.suffix.lower() == ".pdf":
         return [path]
-    return sorted(p for p in path.rglob("*.pdf") if p.is_file())
+    # os.scandir отдаёт имя и тип записи без лишнего stat() и без создания
+    # Path на каждый элемент каталога; Path строим только для найденных PDF.
+    found: List[str] = []
+    stack = [str(path)]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.name.lower().endswith(".pdf") and entry.is_file():
+                            found.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError:
+            # Недоступный каталог (нет прав, удалён во время обхода) пропускаем.
+            logger.debug("Failed to scan %s", current, exc_info=True)
+    return sorted(Path(p) for p in found)
 
 
 def run_cli():
@@ -599,21 +1615,38 @@ def run_cli():
     ap.add_argument("--min-chars-for-ocr", type=int, default=200)
     ap.add_argument("--no-ocr", action="store_true")
     ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--executor", choices=("auto", "thread", "process"), default="auto")
     ap.add_argument("--force-ocr", action="store_true", dest="force_ocr", default=False)
     ap.add_argument("--dpi", type=int, default=300)
+    # DPI быстрого предварительного прохода OCR; 0 отключает его.
+    ap.add_argument("--ocr-fast-dpi", type=int, default=200)
     ap.add_argument("--lang", default="rus+eng")
+    # Дополнительные параметры Tesseract, например "--psm 6". Белый список
+    # только из цифр по умолчанию не включаем: без букв теряются подписи
+    # «Почтовый идентификатор»/«Код доступа», по которым выбираются номера.
+    ap.add_argument("--ocr-config", default="")
+    # Сколько страниц одного файла распознавать одновременно.
+    ap.add_argument("--ocr-page-workers", type=int, default=1)
+    # Распознавать все страницы файла одним запуском Tesseract.
+    ap.add_argument("--ocr-batch", action="store_true")
+    ap.add_argument("--ocr-backend", choices=("tesseract", "paddle"), default="tesseract")
+    # Перед распознаванием целой страницы пробовать только полосы с подписями.
+    ap.add_argument("--ocr-crop", action="store_true")
     # Флаги для GUI: CLI их не использует напрямую, но принимает.
     ap.add_argument("--progress-stdout", action="store_true")
     ap.add_argument("--cancel-file", default="")
     ap.add_argument("--debug-dump-text", default="")
     ap.add_argument("--log", default=None)
+    ap.add_argument("--no-cache", action="store_true")
     args = ap.parse_args()
 
     if args.log:
         _configure_logging(args.log)
+    # Распознанный текст сохраняется между запусками: повторная обработка тех
+    # же файлов не запускает Poppler и Tesseract заново.
+    _configure_disk_cache(None if args.no_cache else _default_cache_path())
 
-    global DEBUG_DUMP_DIR
-    DEBUG_DUMP_DIR = str(Path(args.debug_dump_text).expanduser()) if args.debug_dump_text else None
+    debug_dump_dir = str(Path(args.debug_dump_text).expanduser()) if args.debug_dump_text else None
 
     pdfs = walk_pdfs(Path(args.input))
     total = len(pdfs)
@@ -630,7 +1663,20 @@ def run_cli():
         "force_ocr": args.force_ocr,
         "ocr_dpi": args.dpi,
         "ocr_lang": args.lang,
+        "ocr_config": args.ocr_config,
+        "ocr_fast_dpi": args.ocr_fast_dpi,
+        "debug_dump_dir": debug_dump_dir,
+        "ocr_page_workers": args.ocr_page_workers,
+        "ocr_batch": args.ocr_batch,
+        "ocr_backend": args.ocr_backend,
+        "ocr_crop": args.ocr_crop,
     }
+    executor = args.executor
+    if executor == "auto":
+        # Разбор pdfminer и регулярные выражения держат GIL, поэтому по
+        # умолчанию нужны процессы. При --force-ocr почти всё время уходит на
+        # внешние процессы Poppler/Tesseract, и потоков достаточно.
+        executor = "thread" if args.force_ocr else "process"
 
     progress_cb = None
     if args.progress_stdout:
@@ -645,30 +1691,35 @@ def run_cli():
             }
             print(json.dumps(evt, ensure_ascii=False), flush=True)
 
-    results = process_pdf_files(
-        pdfs,
-        workers=args.workers,
-        process_kwargs=process_kwargs,
-        cancel_file=cancel_file,
-        progress_cb=progress_cb,
-    )
-
+    # Результаты пишем сразу по мере готовности: память не растёт с размером
+    # пакета, а при отмене на диске остаётся корректный частичный файл.
     out_enc = "utf-8-sig" if os.name == "nt" else "utf-8"
-    if args.csv or args.output.lower().endswith(".csv"):
-        with open(args.output, "w", newline="", encoding=out_enc) as f:
-            w = csv.writer(f)
+    as_csv = args.csv or args.output.lower().endswith(".csv")
+    count = 0
+    with open(args.output, "w", newline="" if as_csv else None, encoding=out_enc) as f:
+        w = csv.writer(f) if as_csv else None
+        if w is not None:
             w.writerow(["filename", "track", "code"])
-            for r in results:
+        for r in iter_pdf_results(
+            pdfs,
+            workers=args.workers,
+            process_kwargs=process_kwargs,
+            cancel_file=cancel_file,
+            progress_cb=progress_cb,
+            executor=executor,
+        ):
+            if w is not None:
                 w.writerow([r["source"], r["track"] or "", r["code"] or ""])
-    else:
-        with open(args.output, "w", encoding=out_enc) as f:
-            for r in results:
+            else:
                 f.write(f"{r['source']} - {r['track'] or ''} - {r['code'] or ''}\n")
+            count += 1
+            if args.progress_stdout:
+                f.flush()
 
     if args.progress_stdout:
         print(
             json.dumps(
-                {"event": "done", "count": len(results), "output": args.output},
+                {"event": "done", "count": count, "output": args.output},
                 ensure_ascii=False,
             ),
             flush=True,
@@ -2,9 +2,14 @@
 # -*- coding: utf-8 -*-
 """Минимальный Tkinter-GUI для запуска CLI-утилиты извлечения PDF."""
 
+import functools
 import os
 import sys
 import json
+import locale
+import queue
+import shlex
+import signal
 import subprocess
 import threading
 import tkinter as tk
@@ -13,6 +18,14 @@ from tkinter import ttk, filedialog, messagebox
 
 
 APP_TITLE = "Russian Post PDF Extractor — Minimal GUI"
+# Период, с которым окно забирает накопленный вывод CLI, в миллисекундах.
+OUTPUT_POLL_MS = 30
+# Сколько строк вывода разбирается за один проход, чтобы окно не замирало.
+OUTPUT_BATCH_LINES = 500
+# Сколько последних строк хранит журнал в окне; полный лог пишет --log.
+LOG_MAX_LINES = 5000
+# Файл, в котором между запусками хранятся последние каталоги диалогов.
+DIRS_CONFIG_PATH = Path.home() / ".rp_extractor_gui.json"
 
 
 def is_frozen():
@@ -21,18 +34,58 @@ def is_frozen():
     return getattr(sys, "frozen", False)
 
 
-def find_extractor_cmd():
-    """Находит исполняемый файл CLI для запуска из GUI."""
-
+@functools.lru_cache(maxsize=None)
+def _extractor_cmd():
+    # Расположение CLI не меняется, пока работает GUI: проверяем файлы на
+    # диске один раз, а не при каждом запуске обработки.
     here = os.path.dirname(os.path.abspath(__file__))
     if is_frozen():
         exe = os.path.join(here, "rp_extractor.exe")
         if os.path.exists(exe):
-            return [exe]
+            return (exe,)
     rp_py = os.path.join(here, "rp_extractor.py")
     if os.path.exists(rp_py):
-        return [sys.executable, rp_py]
-    return ["rp_extractor"]
+        return (sys.executable, rp_py)
+    return ("rp_extractor",)
+
+
+def find_extractor_cmd():
+    """Находит исполняемый файл CLI для запуска из GUI."""
+
+    # Возвращаем новый список: вызывающий код дописывает в него аргументы.
+    return list(_extractor_cmd())
+
+
+def kill_process_tree(proc):
+    """Завершает процесс CLI вместе с процессами пула и их Tesseract/Poppler."""
+
+    if os.name == "nt":
+        # taskkill /T обходит всё дерево потомков. CTRL_BREAK_EVENT требует
+        # общей с CLI консоли, которой у оконного GUI нет.
+        subprocess.run(
+            ["taskkill", "/T", "/F", "/PID", str(proc.pid)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0),
+            check=False,
+        )
+    else:
+        # CLI запущен в собственном сеансе: его группа процессов — это он сам
+        # и все потомки, включая воркеров ProcessPoolExecutor.
+        os.killpg(proc.pid, signal.SIGTERM)
+
+
+def load_last_dirs(path=DIRS_CONFIG_PATH):
+    """Читает сохранённые каталоги диалогов; при любой ошибке возвращает пустой словарь."""
+
+    try:
+        with open(path, encoding="utf-8") as fh:
+            data = json.load(fh)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {k: v for k, v in data.items() if isinstance(k, str) and isinstance(v, str)}
 
 
 class App(tk.Tk):
@@ -62,13 +115,25 @@ class App(tk.Tk):
         self.total = 0
         self.done = 0
         self.cancel_file = None
+        # Запущенный процесс CLI; нужен для принудительной остановки.
+        self._proc = None
         self._last_output = ""
         self._cancel_requested = False
         self._saw_done_event = False
+        # Файл из последнего события progress, ещё не показанный в окне.
+        self._pending_progress = None
+        # Вывод CLI поток чтения складывает в очередь, а окно разбирает его
+        # пачками по таймеру: один вызов after на строку перегружал очередь
+        # событий Tk при тысячах JSON-событий.
+        self._out_queue: "queue.SimpleQueue[tuple]" = queue.SimpleQueue()
+        # Диалоги открываются в последнем использованном каталоге: обход
+        # каталога по умолчанию в Windows бывает заметно медленным.
+        self._last_dirs = load_last_dirs()
         # Триггеры обновляют связанные поля при изменении настроек пользователем.
+        # Кнопки «Открыть» проверяют файлы на диске, поэтому для полей путей
+        # они обновляются не на каждое нажатие клавиши, а при выходе из поля
+        # и после выбора файла в диалоге.
         self.csv.trace_add("write", lambda *_: self._ensure_output_extension())
-        self.out_path.trace_add("write", lambda *_: self._update_open_buttons())
-        self.log_path.trace_add("write", lambda *_: self._update_open_buttons())
         self._build_ui()
     def _set_dark_theme(self):
         """Применяет тёмную цветовую схему ко всем элементам управления."""
@@ -104,7 +169,9 @@ class App(tk.Tk):
         ttk.Button(in_btns, text="Папка", command=self.browse_in_dir).pack(fill="x")
 
         ttk.Label(frm, text="Выходной файл:").grid(row=1, column=0, sticky="w", **pad)
-        ttk.Entry(frm, textvariable=self.out_path, width=80).grid(row=1, column=1, columnspan=2, sticky="we", **pad)
+        out_entry = ttk.Entry(frm, textvariable=self.out_path, width=80)
+        out_entry.grid(row=1, column=1, columnspan=2, sticky="we", **pad)
+        out_entry.bind("<FocusOut>", lambda _e: self._update_open_buttons())
         out_btns = ttk.Frame(frm)
         out_btns.grid(row=1, column=3, sticky="nsew", **pad)
         ttk.Button(out_btns, text="Обзор", command=self.browse_out_file).pack(fill="x", pady=(0, 2))
@@ -148,7 +215,9 @@ class App(tk.Tk):
 
         row += 1
         ttk.Label(frm, text="Файл лога (опц.):").grid(row=row, column=0, sticky="w", **pad)
-        ttk.Entry(frm, textvariable=self.log_path).grid(row=row, column=1, columnspan=2, sticky="we", **pad)
+        log_entry = ttk.Entry(frm, textvariable=self.log_path)
+        log_entry.grid(row=row, column=1, columnspan=2, sticky="we", **pad)
+        log_entry.bind("<FocusOut>", lambda _e: self._update_open_buttons())
         log_btns = ttk.Frame(frm)
         log_btns.grid(row=row, column=3, sticky="nsew", **pad)
         ttk.Button(log_btns, text="Обзор", command=self.browse_log).pack(fill="x", pady=(0, 2))
@@ -174,7 +243,7 @@ class App(tk.Tk):
         self.btn_stop.pack(side="left")
 
         row += 1
-        self.txt = tk.Text(frm, height=18, bg="#3c3f41", fg="#ffffff")
+        self.txt = tk.Text(frm, height=18, bg="#3c3f41", fg="#ffffff", insertbackground="#ffffff")
         self.txt.grid(row=row, column=0, columnspan=4, sticky="nsew", **pad)
         frm.rowconfigure(row, weight=1)
 
@@ -183,10 +252,10 @@ class App(tk.Tk):
     def _update_open_buttons(self):
         """Активирует или блокирует кнопки открытия файлов в зависимости от их наличия."""
 
-        out = Path(self.out_path.get().strip())
-        log = Path(self.log_path.get().strip())
-        out_exists = out.is_file()
-        log_exists = log.is_file()
+        out = self.out_path.get().strip()
+        log = self.log_path.get().strip()
+        out_exists = bool(out) and os.path.isfile(out)
+        log_exists = bool(log) and os.path.isfile(log)
         self.btn_open_output.configure(state="normal" if out_exists else "disabled")
         self.btn_open_log.configure(state="normal" if log_exists else "disabled")
 
@@ -196,10 +265,17 @@ class App(tk.Tk):
         try:
             if os.name == "nt":
                 os.startfile(str(path))  # type: ignore[attr-defined]
-            elif sys.platform == "darwin":
-                subprocess.Popen(["open", str(path)])
             else:
-                subprocess.Popen(["xdg-open", str(path)])
+                opener = "open" if sys.platform == "darwin" else "xdg-open"
+                # Помощник не должен наследовать потоки ввода-вывода окна и
+                # его сеанс: он живёт дольше вызова и отвязан от GUI.
+                subprocess.Popen(
+                    [opener, str(path)],
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    start_new_session=True,
+                )
         except Exception as exc:  # pragma: no cover - platform dependent
             messagebox.showerror("Ошибка", f"Не удалось открыть {path}: {exc}")
 
@@ -267,6 +343,7 @@ class App(tk.Tk):
         self.done = 0
         self._saw_done_event = False
         self._last_output = ""
+        self._pending_progress = None
         self.pb.configure(mode="determinate", maximum=1, value=0)
         self.pb_txt.configure(text="0/0")
 
@@ -294,19 +371,36 @@ class App(tk.Tk):
                 self.status_var.set("Завершено.")
         self._update_open_buttons()
         self._cancel_requested = False
+    def _remember_dir(self, key: str, directory: str):
+        """Запоминает каталог диалога и сохраняет его для следующих запусков."""
+
+        if not directory or self._last_dirs.get(key) == directory:
+            return
+        self._last_dirs[key] = directory
+        try:
+            with open(DIRS_CONFIG_PATH, "w", encoding="utf-8") as fh:
+                json.dump(self._last_dirs, fh, ensure_ascii=False)
+        except OSError:
+            # Без сохранённых каталогов GUI работает как раньше.
+            pass
+
     def browse_in_file(self):
         """Открывает диалог выбора PDF-файла для обработки."""
 
-        path = filedialog.askopenfilename(filetypes=[("PDF", "*.pdf")])
+        path = filedialog.askopenfilename(
+            filetypes=[("PDF", "*.pdf")], initialdir=self._last_dirs.get("input")
+        )
         if path:
+            self._remember_dir("input", os.path.dirname(path))
             self.in_path.set(path)
             self._auto_fill_output(Path(path))
 
     def browse_in_dir(self):
         """Выбирает папку, содержащую PDF-файлы."""
 
-        path = filedialog.askdirectory()
+        path = filedialog.askdirectory(initialdir=self._last_dirs.get("input"))
         if path:
+            self._remember_dir("input", path)
             self.in_path.set(path)
             self._auto_fill_output(Path(path))
 
@@ -316,16 +410,19 @@ class App(tk.Tk):
         path = filedialog.asksaveasfilename(
             defaultextension=".csv",
             filetypes=[("CSV", "*.csv"), ("TXT", "*.txt"), ("Все", "*.*")],
+            initialdir=self._last_dirs.get("output"),
         )
         if path:
+            self._remember_dir("output", os.path.dirname(path))
             self.out_path.set(path)
             self._ensure_output_extension()
 
     def browse_dump_dir(self):
         """Выбирает каталог, куда сохранять текстовые дампы для отладки."""
 
-        path = filedialog.askdirectory()
+        path = filedialog.askdirectory(initialdir=self._last_dirs.get("dump"))
         if path:
+            self._remember_dir("dump", path)
             self.dump_dir.set(path)
 
     def browse_log(self):
@@ -334,8 +431,10 @@ class App(tk.Tk):
         path = filedialog.asksaveasfilename(
             defaultextension=".log",
             filetypes=[("Log", "*.log"), ("All", "*.*")],
+            initialdir=self._last_dirs.get("log"),
         )
         if path:
+            self._remember_dir("log", os.path.dirname(path))
             self.log_path.set(path)
             self._update_open_buttons()
     def build_cmd(self, cancel_file: str):
@@ -411,17 +510,38 @@ class App(tk.Tk):
                 except OSError:
                     pass
         cmd = self.build_cmd(str(cancel_path))
-        self._append(">> " + " ".join(cmd))
+        # Команду показываем с кавычками по правилам оболочки ОС, чтобы её
+        # можно было скопировать в терминал и для путей с пробелами.
+        shown = subprocess.list2cmdline(cmd) if os.name == "nt" else shlex.join(cmd)
+        self._append(">> " + shown)
         self._reset_progress()
         self._set_running(True)
         self.status_var.set("Запуск...")
         self._cancel_requested = False
         threading.Thread(target=self._run_proc, args=(cmd,), daemon=True).start()
+        self.after(OUTPUT_POLL_MS, self._poll_output)
     def stop_run(self):
-        """Создаёт файл-флаг отмены, чтобы остановить текущий запуск."""
+        """Создаёт файл-флаг отмены, чтобы остановить текущий запуск.
+
+        Повторное нажатие «Стоп» принудительно завершает CLI вместе со всеми
+        его дочерними процессами.
+        """
 
         if not self.cancel_file:
             return
+        if self._cancel_requested:
+            # Через файл CLI останавливается мягко и успевает дописать
+            # частичный результат. Если ждать некогда, завершаем процесс.
+            # Только родителя недостаточно: воркеры пула и запущенные ими
+            # Tesseract и Poppler продолжили бы работу.
+            proc = self._proc
+            if proc is not None and proc.poll() is None:
+                try:
+                    kill_process_tree(proc)
+                    self._append("[CANCEL] Процесс остановлен принудительно.")
+                except Exception as exc:
+                    self._append(f"[CANCEL ERROR] {exc}")
+            return
         try:
             with open(self.cancel_file, "w", encoding="utf-8") as fh:
                 fh.write("1")
@@ -431,57 +551,142 @@ class App(tk.Tk):
         except Exception as exc:
             self._append(f"[CANCEL ERROR] {exc}")
     def _run_proc(self, cmd):
-        """Запускает CLI в отдельном потоке и транслирует события в GUI."""
+        """Запускает CLI в отдельном потоке и передаёт его вывод в очередь для GUI."""
 
         rc = None
         try:
             si = None
+            # CLI получает собственную группу процессов, чтобы «Стоп» мог
+            # завершить его вместе с потомками (см. kill_process_tree).
+            popen_kwargs = {}
             if os.name == "nt":
                 try:
                     si = subprocess.STARTUPINFO()
                     si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
                 except Exception:
                     si = None
+                popen_kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+            else:
+                popen_kwargs["start_new_session"] = True
             with subprocess.Popen(
                 cmd,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,
-                bufsize=1,
-                text=True,
                 startupinfo=si,
+                **popen_kwargs,
             ) as proc:
+                self._proc = proc
                 assert proc.stdout is not None
-                for raw in proc.stdout:
-                    line = raw.rstrip("\n")
-                    self.after(0, self._handle_line, line)
+                # Читаем канал крупными блоками и декодируем один раз на блок,
+                # а не построчно в текстовом режиме. Кодировка та же, что была
+                # у text=True и у stdout самого CLI, — кодировка локали.
+                fd = proc.stdout.fileno()
+                encoding = locale.getpreferredencoding(False)
+                pending = b""
+                while True:
+                    chunk = os.read(fd, 65536)
+                    if not chunk:
+                        break
+                    complete, sep, pending = (pending + chunk).rpartition(b"\n")
+                    if sep:
+                        text = complete.decode(encoding, "replace").replace("\r", "")
+                        self._out_queue.put(("lines", text.split("\n")))
+                if pending:
+                    self._out_queue.put(("lines", [pending.decode(encoding, "replace").rstrip("\r")]))
                 rc = proc.wait()
-                self.after(0, self._append, f"[EXIT] Return code: {rc}")
+                self._out_queue.put(("append", f"[EXIT] Return code: {rc}"))
         except Exception as exc:
-            self.after(0, self._append, f"[ERROR] {exc}")
+            self._out_queue.put(("append", f"[ERROR] {exc}"))
         finally:
-            self.after(0, self._on_run_finished, rc)
+            self._proc = None
+            self._out_queue.put(("finished", rc))
+
+    def _poll_output(self):
+        """Разбирает накопленный вывод CLI и планирует следующую проверку."""
+
+        # Строки всей пачки вставляются в журнал одним вызовом, а индикатор
+        # и статус обновляются один раз — по последнему событию progress.
+        # Если вывод идёт быстрее, чем его успевает разбирать окно, остаток
+        # очереди забирается следующим проходом сразу после обработки событий Tk.
+        msgs = []
+        finished = False
+        rc = None
+        handled = 0
+        while handled < OUTPUT_BATCH_LINES:
+            try:
+                kind, payload = self._out_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "lines":
+                handled += len(payload)
+                for line in payload:
+                    msg = self._handle_line(line)
+                    if msg:
+                        msgs.append(msg)
+            elif kind == "append":
+                msgs.append(payload)
+            else:
+                finished, rc = True, payload
+                break
+        if msgs:
+            self._append("\n".join(msgs))
+        self._flush_progress()
+        if finished:
+            self._on_run_finished(rc)
+            return
+        delay = 1 if handled >= OUTPUT_BATCH_LINES else OUTPUT_POLL_MS
+        self.after(delay, self._poll_output)
     def _append(self, msg):
         """Добавляет строку в текстовый журнал внизу окна."""
 
         self.txt.insert("end", msg + "\n")
+        # Без ограничения виджет растёт на каждый файл пакета, и вставка с
+        # прокруткой замедляется на длинных запусках.
+        lines = int(self.txt.index("end-1c").split(".")[0])
+        if lines > LOG_MAX_LINES:
+            self.txt.delete("1.0", f"{lines - LOG_MAX_LINES}.0")
         self.txt.see("end")
 
+    def _flush_progress(self):
+        """Показывает в индикаторе и статусе последнее событие progress."""
+
+        if self._pending_progress is None:
+            return
+        file_name = self._pending_progress
+        self._pending_progress = None
+        maximum = max(1, self.total)
+        self.pb.configure(maximum=maximum, value=min(self.done, maximum))
+        if self.total:
+            processed = min(self.done, self.total)
+            self.pb_txt.configure(text=f"{processed}/{self.total}")
+            self.status_var.set(f"Обработано {processed}/{self.total}: {file_name}")
+        else:
+            self.pb_txt.configure(text=str(self.done))
+            self.status_var.set(f"Обработано {self.done}: {file_name}")
+
     def _handle_line(self, line: str):
-        """Обрабатывает строку вывода CLI, распознавая JSON-события."""
+        """Обрабатывает строку вывода CLI и возвращает текст для журнала.
+
+        События progress только обновляют счётчики; индикатор перерисовывает
+        ``_flush_progress`` один раз на пачку строк.
+        """
 
+        # События CLI — JSON-объекты; прочие строки (ошибки, вывод библиотек)
+        # отсекаем без попытки разбора и исключения JSONDecodeError.
+        if not line.startswith("{"):
+            return line
         try:
             evt = json.loads(line)
         except json.JSONDecodeError:
-            self._append(line)
-            return
+            return line
         if not isinstance(evt, dict):
-            self._append(line)
-            return
+            return line
 
         event = evt.get("event")
         if event == "start":
             self.total = int(evt.get("total") or 0)
             self.done = 0
+            self._pending_progress = None
             maximum = max(1, self.total)
             self.pb.configure(mode="determinate", maximum=maximum, value=0)
             self.pb_txt.configure(text=f"0/{self.total}")
@@ -489,32 +694,23 @@ class App(tk.Tk):
                 self.status_var.set(f"Файлов к обработке: {self.total}")
             else:
                 self.status_var.set("Нет PDF для обработки.")
-            return
+            return None
 
         if event == "progress":
             self.done += 1
-            maximum = max(1, self.total)
-            self.pb.configure(maximum=maximum, value=min(self.done, maximum))
-            if self.total:
-                processed = min(self.done, self.total)
-                self.pb_txt.configure(text=f"{processed}/{self.total}")
-            else:
-                self.pb_txt.configure(text=str(self.done))
             file_name = evt.get("file", "")
+            self._pending_progress = file_name
             track = evt.get("track", "") or ""
             code = evt.get("code", "") or ""
             method = evt.get("method", "") or ""
-            if self.total:
-                self.status_var.set(f"Обработано {processed}/{self.total}: {file_name}")
-            else:
-                self.status_var.set(f"Обработано {self.done}: {file_name}")
             details = " ".join(part for part in (track, code) if part)
             if method:
                 details = f"{details} ({method})" if details else f"({method})"
-            self._append(f"[OK] {file_name} -> {details}" if details else f"[OK] {file_name}")
-            return
+            return f"[OK] {file_name} -> {details}" if details else f"[OK] {file_name}"
 
         if event == "done":
+            # Итоговый статус не должен затереться отложенным progress.
+            self._flush_progress()
             self._saw_done_event = True
             self._cancel_requested = False
             count = evt.get("count")
@@ -525,10 +721,9 @@ class App(tk.Tk):
                 self.status_var.set(f"Готово: {count_display} записей -> {output}")
             else:
                 self.status_var.set(f"Готово: {count_display} записей")
-            self._append(f"[DONE] Wrote {count_display} records to {output}")
             self._update_open_buttons()
-            return
+            return f"[DONE] Wrote {count_display} records to {output}"
 
-        self._append(line)
+        return line
 if __name__=="__main__":
     app=App(); app.mainloop()
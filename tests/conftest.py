@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# Корень репозитория добавляется в sys.path один раз на сессию pytest, чтобы
+# тесты импортировали rp_extractor из исходников без установки пакета.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
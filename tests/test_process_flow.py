@@ -1,8 +1,10 @@
+import os
 import sys
+import threading
 import time
 from pathlib import Path
 
-sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import pytest
 
 import rp_extractor
 
@@ -13,6 +15,33 @@ def _make_pdf(tmp_path: Path, name: str) -> Path:
     return path
 
 
+def _make_text_pdf(path: Path, pages) -> Path:
+    # Минимальный PDF с ASCII-текстом шрифтом Helvetica, по строке на страницу.
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        body = body if isinstance(body, bytes) else body.encode("latin-1")
+        out += b"%d 0 obj\n" % num + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(bytes(out))
+    return path
+
+
 def test_process_pdf_uses_ocr_when_text_short(tmp_path, monkeypatch):
     pdf = _make_pdf(tmp_path, "short.pdf")
 
@@ -78,6 +107,28 @@ def test_process_pdf_skips_ocr_when_text_sufficient(tmp_path, monkeypatch):
     assert res["method"] == ""
 
 
+def test_process_pdf_whitespace_text_layer_still_uses_ocr(tmp_path, monkeypatch):
+    pdf = _make_pdf(tmp_path, "blank.pdf")
+
+    monkeypatch.setattr(rp_extractor, "get_page_count", lambda _: 1)
+    monkeypatch.setattr(rp_extractor, "extract_page_text_pdfminer", lambda *_: " \n" * 300)
+
+    ocr_calls = []
+
+    def fake_ocr(_pdf, pidx, **_kwargs):
+        ocr_calls.append(pidx)
+        return "ПОЧТА РОССИИ\nПочтовый идентификатор: 80065036285004\nКод доступа: 12345678"
+
+    monkeypatch.setattr(rp_extractor, "extract_page_text_ocr", fake_ocr)
+
+    res = rp_extractor.process_pdf(pdf, min_chars_for_ocr=200, enable_ocr=True)
+
+    assert ocr_calls == [0]
+    assert res["track"] == "80065036285004"
+    assert res["code"] == "12345678"
+    assert res["method"] == "ocr"
+
+
 def test_process_pdf_files_parallel_order_preserved(tmp_path, monkeypatch):
     pdfs = [_make_pdf(tmp_path, name) for name in ("a.pdf", "b.pdf", "c.pdf")]
 
@@ -130,3 +181,772 @@ def test_process_pdf_files_respects_cancel_file(tmp_path, monkeypatch):
 
     assert results == []
     assert called == []
+
+
+def test_process_pdf_files_process_pool_order_preserved(tmp_path):
+    pdfs = [_make_pdf(tmp_path, name) for name in ("a.pdf", "b.pdf", "c.pdf")]
+
+    results = rp_extractor.process_pdf_files(
+        pdfs,
+        workers=2,
+        process_kwargs={"enable_ocr": False, "cancel_cb": None},
+        executor="process",
+    )
+
+    assert [rec["source"] for rec in results] == [p.name for p in pdfs]
+    assert all(rec["track"] is None and rec["code"] is None for rec in results)
+
+
+def test_extract_page_text_pdfminer_cached_until_file_changes(tmp_path, monkeypatch):
+    pdf = _make_pdf(tmp_path, "cached.pdf")
+    calls = []
+
+    def fake_extract_text(path, page_numbers):
+        calls.append(page_numbers[0])
+        return f"page {page_numbers[0]}"
+
+    monkeypatch.setattr(rp_extractor, "_pdfminer_available", True)
+    monkeypatch.setattr(rp_extractor, "extract_text", fake_extract_text)
+    rp_extractor._PAGE_TEXT_CACHE.clear()
+
+    assert rp_extractor.extract_page_text_pdfminer(pdf, 0) == "page 0"
+    assert rp_extractor.extract_page_text_pdfminer(pdf, 0) == "page 0"
+    assert calls == [0]
+
+    stat = pdf.stat()
+    os.utime(pdf, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert rp_extractor.extract_page_text_pdfminer(pdf, 0) == "page 0"
+    assert calls == [0, 0]
+
+
+def test_process_pdf_parses_document_once_for_all_pages(tmp_path, monkeypatch):
+    pytest.importorskip("pdfminer")
+    pdf = _make_text_pdf(tmp_path / "three.pdf", ["first", "second", "third"])
+    parses = []
+    real_parser = rp_extractor.PDFParser
+
+    def counting_parser(fh):
+        parses.append(fh)
+        return real_parser(fh)
+
+    def no_extract_text(*_args, **_kwargs):
+        raise AssertionError("pages should come from the already parsed document")
+
+    seen = []
+
+    def fake_sniff(text: str):
+        seen.append(text.strip())
+        return None, None
+
+    monkeypatch.setattr(rp_extractor, "fitz", None)
+    monkeypatch.setattr(rp_extractor, "PDFParser", counting_parser)
+    monkeypatch.setattr(rp_extractor, "extract_text", no_extract_text)
+    monkeypatch.setattr(rp_extractor, "sniff_track_code_with_labels", fake_sniff)
+    rp_extractor._PAGE_TEXT_CACHE.clear()
+
+    rp_extractor.process_pdf(pdf, max_pages_back=3, enable_ocr=False)
+
+    # Страницы читаются с конца, затем проверяется их склейка в порядке документа.
+    assert seen[:3] == ["third", "second", "first"]
+    assert seen[3].split() == ["first", "second", "third"]
+    assert len(parses) == 1
+
+
+def test_process_pdf_prefers_pymupdf_and_falls_back_to_pdfminer(tmp_path, monkeypatch):
+    opened = []
+
+    class FakePage:
+        def __init__(self, pidx):
+            self.pidx = pidx
+
+        def get_text(self, kind):
+            return f"fitz page {self.pidx}"
+
+    class FakeFitzDoc:
+        page_count = 2
+
+        def load_page(self, pidx):
+            return FakePage(pidx)
+
+        def close(self):
+            pass
+
+    class FakeFitz:
+        @staticmethod
+        def open(path):
+            opened.append(path)
+            if path.endswith("broken.pdf"):
+                raise RuntimeError("cannot open")
+            return FakeFitzDoc()
+
+    seen = []
+
+    def fake_sniff(text: str):
+        seen.append(text.strip())
+        return None, None
+
+    monkeypatch.setattr(rp_extractor, "fitz", FakeFitz)
+    monkeypatch.setattr(rp_extractor, "sniff_track_code_with_labels", fake_sniff)
+    rp_extractor._PAGE_TEXT_CACHE.clear()
+
+    rp_extractor.process_pdf(_make_pdf(tmp_path, "fast.pdf"), max_pages_back=5, enable_ocr=False)
+    assert seen == ["fitz page 1", "fitz page 0", "fitz page 0\nfitz page 1"]
+    assert len(opened) == 1
+
+    pytest.importorskip("pdfminer")
+    seen.clear()
+    rp_extractor.process_pdf(_make_text_pdf(tmp_path / "broken.pdf", ["only"]), enable_ocr=False)
+    assert seen == ["only"]
+
+
+def test_disk_cache_does_not_serve_pdfminer_text_when_pymupdf_is_active(tmp_path, monkeypatch):
+    pytest.importorskip("pdfminer")
+    pdf = _make_text_pdf(tmp_path / "layer.pdf", ["pdfminer layout"])
+
+    class FakePage:
+        def get_text(self, kind):
+            return "fitz layout"
+
+    class FakeFitzDoc:
+        page_count = 1
+
+        def load_page(self, pidx):
+            return FakePage()
+
+        def close(self):
+            pass
+
+    class FakeFitz:
+        @staticmethod
+        def open(path):
+            return FakeFitzDoc()
+
+    seen = []
+
+    def fake_sniff(text: str):
+        seen.append(text.strip())
+        return None, None
+
+    monkeypatch.setattr(rp_extractor, "sniff_track_code_with_labels", fake_sniff)
+    rp_extractor._configure_disk_cache(str(tmp_path / "cache" / "ocr.sqlite"))
+    try:
+        monkeypatch.setattr(rp_extractor, "fitz", None)
+        rp_extractor._PAGE_TEXT_CACHE.clear()
+        rp_extractor.process_pdf(pdf, enable_ocr=False)
+
+        monkeypatch.setattr(rp_extractor, "fitz", FakeFitz)
+        rp_extractor._PAGE_TEXT_CACHE.clear()
+        rp_extractor.process_pdf(pdf, enable_ocr=False)
+    finally:
+        rp_extractor._configure_disk_cache(None)
+
+    assert seen == ["pdfminer layout", "fitz layout"]
+
+
+def test_process_pdf_text_on_any_page_prevents_ocr(tmp_path, monkeypatch):
+    pdf = _make_pdf(tmp_path, "two_pages.pdf")
+
+    monkeypatch.setattr(rp_extractor, "get_page_count", lambda _: 2)
+    texts = {1: "short", 0: "labelled text"}
+    monkeypatch.setattr(rp_extractor, "extract_page_text_pdfminer", lambda _pdf, pidx: texts[pidx])
+
+    def fake_sniff(text: str):
+        if text == "labelled text":
+            return "80065036285004", "12345678"
+        return None, None
+
+    def fake_ocr(*_args, **_kwargs):
+        raise AssertionError("OCR should not run when another page has a text layer")
+
+    monkeypatch.setattr(rp_extractor, "sniff_track_code_with_labels", fake_sniff)
+    monkeypatch.setattr(rp_extractor, "extract_page_text_ocr", fake_ocr)
+
+    res = rp_extractor.process_pdf(pdf, max_pages_back=5, enable_ocr=True)
+
+    assert res["track"] == "80065036285004"
+    assert res["code"] == "12345678"
+    assert res["method"] == "text"
+
+
+def test_process_pdf_reuses_sniff_result_for_same_text(tmp_path, monkeypatch):
+    pdf = _make_pdf(tmp_path, "repeat.pdf")
+
+    monkeypatch.setattr(rp_extractor, "get_page_count", lambda _: 1)
+    monkeypatch.setattr(rp_extractor, "extract_page_text_pdfminer", lambda _pdf, _pidx: "same text")
+
+    calls = []
+
+    def fake_sniff(text: str):
+        calls.append(text)
+        return "80065036285004", "12345678"
+
+    monkeypatch.setattr(rp_extractor, "sniff_track_code_with_labels", fake_sniff)
+    rp_extractor._SNIFF_CACHE.clear()
+
+    first = rp_extractor.process_pdf(pdf, enable_ocr=False)
+    second = rp_extractor.process_pdf(pdf, enable_ocr=False)
+
+    assert calls == ["same text"]
+    assert first["track"] == second["track"] == "80065036285004"
+    assert second["code"] == "12345678"
+
+
+def test_process_pdf_joins_pages_before_falling_back_to_ocr(tmp_path, monkeypatch):
+    pdf = _make_pdf(tmp_path, "split.pdf")
+    texts = {
+        0: "ПОЧТА РОССИИ\nПочтовый идентификатор: 8006 5036 2850 04",
+        1: "Код доступа: 1234 5678\n",
+    }
+
+    def fake_ocr(*_args, **_kwargs):
+        raise AssertionError("OCR should not run when the pages together contain both numbers")
+
+    monkeypatch.setattr(rp_extractor, "get_page_count", lambda _: 2)
+    monkeypatch.setattr(rp_extractor, "extract_page_text_pdfminer", lambda _pdf, pidx: texts[pidx])
+    monkeypatch.setattr(rp_extractor, "extract_page_text_ocr", fake_ocr)
+
+    res = rp_extractor.process_pdf(pdf, min_chars_for_ocr=200, enable_ocr=True)
+
+    assert res["track"] == "80065036285004"
+    assert res["code"] == "12345678"
+    assert res["method"] == "text"
+
+
+def test_process_pdf_renders_ocr_pages_in_bounded_chunks(tmp_path, monkeypatch):
+    pdf = _make_pdf(tmp_path, "scan.pdf")
+    render_calls = []
+    found_on = []
+
+    def fake_convert(path, dpi, first_page, last_page, **_kwargs):
+        render_calls.append((first_page, last_page))
+        return [f"img{n}" for n in range(first_page, last_page + 1)]
+
+    class FakeTesseract:
+        @staticmethod
+        def image_to_string(image, lang, config=""):
+            return f"ocr {image}"
+
+    def fake_sniff(text: str):
+        if text in found_on:
+            return "80065036285004", "12345678"
+        return None, None
+
+    monkeypatch.setattr(rp_extractor, "OCR_AVAILABLE", True)
+    monkeypatch.setattr(rp_extractor, "convert_from_path", fake_convert)
+    monkeypatch.setattr(rp_extractor, "pytesseract", FakeTesseract)
+    monkeypatch.setattr(rp_extractor, "get_page_count", lambda _: 5)
+    monkeypatch.setattr(rp_extractor, "extract_page_text_pdfminer", lambda *_: "")
+    monkeypatch.setattr(rp_extractor, "sniff_track_code_with_labels", fake_sniff)
+
+    # Пара на последней странице: остальные страницы не рендерятся.
+    found_on[:] = ["ocr img5"]
+    rp_extractor._OCR_TEXT_CACHE.clear()
+    res = rp_extractor.process_pdf(pdf, max_pages_back=5, enable_ocr=True, ocr_fast_dpi=0)
+
+    assert render_calls == [(4, 5)]
+    assert res["method"] == "ocr"
+    assert res["track"] == "80065036285004"
+
+    # Пара на первой странице: порции по две страницы, последняя — одиночная.
+    found_on[:] = ["ocr img1"]
+    render_calls.clear()
+    rp_extractor._OCR_TEXT_CACHE.clear()
+    rp_extractor._SNIFF_CACHE.clear()
+    res = rp_extractor.process_pdf(pdf, max_pages_back=5, enable_ocr=True, ocr_fast_dpi=0)
+
+    assert render_calls == [(4, 5), (2, 3), (1, 1)]
+    assert res["method"] == "ocr"
+
+
+def test_render_pages_for_ocr_skips_gaps_between_runs(tmp_path, monkeypatch):
+    pdf = _make_pdf(tmp_path, "scan.pdf")
+    render_calls = []
+
+    def fake_convert(path, dpi, first_page, last_page, **kwargs):
+        assert kwargs.get("grayscale") is True
+        render_calls.append((first_page, last_page))
+        return [f"img{n}" for n in range(first_page, last_page + 1)]
+
+    monkeypatch.setattr(rp_extractor, "OCR_AVAILABLE", True)
+    monkeypatch.setattr(rp_extractor, "convert_from_path", fake_convert)
+
+    images = rp_extractor.render_pages_for_ocr(pdf, [9, 8, 5, 4], dpi=200)
+
+    assert render_calls == [(5, 6), (9, 10)]
+    assert images == {4: "img5", 5: "img6", 8: "img9", 9: "img10"}
+
+
+def test_get_page_count_reads_catalog_count(tmp_path, monkeypatch):
+    pytest.importorskip("pdfminer")
+    pdf = _make_text_pdf(tmp_path / "three.pdf", ["one", "two", "three"])
+
+    class NoEnumeration:
+        @staticmethod
+        def create_pages(_doc):
+            raise AssertionError("pages should not be enumerated when /Count is present")
+
+    monkeypatch.setattr(rp_extractor, "PDFPage", NoEnumeration)
+
+    assert rp_extractor.get_page_count(pdf) == 3
+
+
+def test_pdf_document_reads_through_mmap_and_releases_it(tmp_path, monkeypatch):
+    pytest.importorskip("pdfminer")
+    monkeypatch.setattr(rp_extractor, "fitz", None)
+    doc = rp_extractor._PdfDocument(_make_text_pdf(tmp_path / "mapped.pdf", ["first", "second"]))
+
+    assert doc.page_text(1).strip() == "second"
+    mapped = doc._mm
+    assert mapped is not None
+
+    doc.close()
+    assert mapped.closed
+    assert doc._mm is None and doc._fh is None
+
+
+def test_walk_pdfs_recurses_and_matches_extension_case_insensitively(tmp_path):
+    nested = tmp_path / "nested" / "deeper"
+    nested.mkdir(parents=True)
+    expected = [
+        _make_pdf(tmp_path, "a.pdf"),
+        _make_pdf(tmp_path / "nested", "B.PDF"),
+        _make_pdf(nested, "c.pdf"),
+    ]
+    (tmp_path / "notes.txt").write_text("not a pdf")
+    (tmp_path / "folder.pdf").mkdir()
+
+    assert rp_extractor.walk_pdfs(tmp_path) == sorted(expected)
+    assert rp_extractor.walk_pdfs(expected[0]) == [expected[0]]
+    assert rp_extractor.walk_pdfs(tmp_path / "missing") == []
+
+
+def test_iter_pdf_results_streams_in_input_order(tmp_path, monkeypatch):
+    pdfs = [_make_pdf(tmp_path, name) for name in ("a.pdf", "b.pdf", "c.pdf")]
+    release_last = threading.Event()
+
+    def fake_process(pdf_path: Path, **_kwargs):
+        if pdf_path.name == "a.pdf":
+            time.sleep(0.02)
+        if pdf_path.name == "c.pdf":
+            release_last.wait(5)
+        return {"source": pdf_path.name, "track": None, "code": None, "method": "text"}
+
+    monkeypatch.setattr(rp_extractor, "process_pdf", fake_process)
+
+    results = rp_extractor.iter_pdf_results(pdfs, workers=3, process_kwargs={})
+    # Первые файлы доступны, пока последний ещё обрабатывается.
+    assert next(results)["source"] == "a.pdf"
+    assert next(results)["source"] == "b.pdf"
+    release_last.set()
+    assert [rec["source"] for rec in results] == ["c.pdf"]
+
+
+def test_cancel_checker_rechecks_file_only_after_interval(tmp_path):
+    cancel_path = tmp_path / "stop.flag"
+
+    throttled = rp_extractor._cancel_checker(str(cancel_path), interval=3600)
+    assert throttled() is False
+    cancel_path.write_text("stop")
+    assert throttled() is False
+
+    eager = rp_extractor._cancel_checker(str(cancel_path), interval=0)
+    assert eager() is True
+    cancel_path.unlink()
+    assert eager() is True
+    assert rp_extractor._cancel_checker(None)() is False
+
+
+def test_extract_page_text_ocr_passes_config_and_caches_per_config(tmp_path, monkeypatch):
+    pdf = _make_pdf(tmp_path, "scan.pdf")
+    calls = []
+
+    class FakeTesseract:
+        @staticmethod
+        def image_to_string(image, lang, config=""):
+            calls.append(config)
+            return f"text {config}"
+
+    monkeypatch.setattr(rp_extractor, "OCR_AVAILABLE", True)
+    monkeypatch.setattr(rp_extractor, "convert_from_path", lambda *_a, **_k: ["img"])
+    monkeypatch.setattr(rp_extractor, "pytesseract", FakeTesseract)
+    rp_extractor._OCR_TEXT_CACHE.clear()
+
+    assert rp_extractor.extract_page_text_ocr(pdf, 0, config="--psm 6") == "text --psm 6"
+    assert rp_extractor.extract_page_text_ocr(pdf, 0, config="--psm 6") == "text --psm 6"
+    assert rp_extractor.extract_page_text_ocr(pdf, 0) == "text "
+    assert calls == ["--psm 6", ""]
+
+
+def test_process_pdf_retries_ocr_at_full_dpi_only_when_fast_pass_misses(tmp_path, monkeypatch):
+    pdf = _make_pdf(tmp_path, "scan.pdf")
+    ocr_dpis = []
+    configs = []
+
+    def fake_ocr(_pdf, _pidx, dpi, binarize=False, config="", **_kwargs):
+        ocr_dpis.append(dpi)
+        configs.append(config)
+        # Бинаризация нужна только быстрому проходу.
+        assert binarize == (dpi == 200)
+        return f"ocr {dpi}"
+
+    def fake_sniff(text: str):
+        if text == "ocr 300":
+            return "80065036285004", "12345678"
+        return None, None
+
+    monkeypatch.setattr(rp_extractor, "get_page_count", lambda _: 1)
+    monkeypatch.setattr(rp_extractor, "extract_page_text_pdfminer", lambda *_: "")
+    monkeypatch.setattr(rp_extractor, "extract_page_text_ocr", fake_ocr)
+    monkeypatch.setattr(rp_extractor, "sniff_track_code_with_labels", fake_sniff)
+
+    res = rp_extractor.process_pdf(pdf, enable_ocr=True, ocr_dpi=300, ocr_fast_dpi=200)
+
+    assert ocr_dpis == [200, 300]
+    assert configs == ["--psm 6", ""]
+    assert res["method"] == "ocr"
+
+    # Заданный пользователем режим сегментации не переопределяется.
+    configs.clear()
+    rp_extractor.process_pdf(pdf, enable_ocr=True, ocr_dpi=300, ocr_fast_dpi=200, ocr_config="--psm 4")
+    assert configs == ["--psm 4", "--psm 4"]
+
+    ocr_dpis.clear()
+    rp_extractor.process_pdf(pdf, enable_ocr=True, ocr_dpi=300, ocr_fast_dpi=0)
+    assert ocr_dpis == [300]
+
+
+def test_process_pdf_ocr_pages_in_parallel_keeps_page_priority(tmp_path, monkeypatch):
+    pdf = _make_pdf(tmp_path, "scan.pdf")
+    barrier = threading.Barrier(3, timeout=5)
+
+    def fake_ocr(_pdf, pidx, **_kwargs):
+        # Все три страницы должны распознаваться одновременно, иначе барьер не пройдёт.
+        barrier.wait()
+        if pidx == 2:
+            time.sleep(0.05)
+        return f"ocr {pidx}"
+
+    def fake_sniff(text: str):
+        if text in ("ocr 2", "ocr 1"):
+            return "80065036285004", text[-1] * 8
+        return None, None
+
+    monkeypatch.setattr(rp_extractor, "get_page_count", lambda _: 3)
+    monkeypatch.setattr(rp_extractor, "extract_page_text_pdfminer", lambda *_: "")
+    monkeypatch.setattr(rp_extractor, "extract_page_text_ocr", fake_ocr)
+    monkeypatch.setattr(rp_extractor, "sniff_track_code_with_labels", fake_sniff)
+
+    res = rp_extractor.process_pdf(pdf, enable_ocr=True, ocr_fast_dpi=0, ocr_page_workers=3)
+
+    assert res["code"] == "22222222"
+    assert res["method"] == "ocr"
+
+
+def test_extract_page_text_ocr_reuses_disk_cache_across_runs(tmp_path, monkeypatch):
+    pdf = _make_pdf(tmp_path, "scan.pdf")
+    calls = []
+
+    class FakeTesseract:
+        @staticmethod
+        def image_to_string(image, lang, config=""):
+            calls.append(image)
+            return "recognised"
+
+    monkeypatch.setattr(rp_extractor, "OCR_AVAILABLE", True)
+    monkeypatch.setattr(rp_extractor, "convert_from_path", lambda *_a, **_k: ["img"])
+    monkeypatch.setattr(rp_extractor, "pytesseract", FakeTesseract)
+    rp_extractor._configure_disk_cache(str(tmp_path / "cache" / "ocr.sqlite"))
+    try:
+        rp_extractor._OCR_TEXT_CACHE.clear()
+        assert rp_extractor.extract_page_text_ocr(pdf, 0) == "recognised"
+        # Новый запуск CLI начинается с пустого кэша в памяти.
+        rp_extractor._OCR_TEXT_CACHE.clear()
+        assert rp_extractor.extract_page_text_ocr(pdf, 0) == "recognised"
+        assert calls == ["img"]
+    finally:
+        rp_extractor._configure_disk_cache(None)
+
+
+def test_extract_page_text_pdfminer_reuses_disk_cache_until_size_changes(tmp_path, monkeypatch):
+    pdf = _make_pdf(tmp_path, "layer.pdf")
+    calls = []
+
+    def fake_extract_text(path, page_numbers):
+        calls.append(page_numbers[0])
+        return "layer text"
+
+    monkeypatch.setattr(rp_extractor, "_pdfminer_available", True)
+    monkeypatch.setattr(rp_extractor, "extract_text", fake_extract_text)
+    rp_extractor._configure_disk_cache(str(tmp_path / "cache" / "ocr.sqlite"))
+    try:
+        rp_extractor._PAGE_TEXT_CACHE.clear()
+        assert rp_extractor.extract_page_text_pdfminer(pdf, 0) == "layer text"
+        rp_extractor._PAGE_TEXT_CACHE.clear()
+        assert rp_extractor.extract_page_text_pdfminer(pdf, 0) == "layer text"
+        assert calls == [0]
+
+        # Перезапись с тем же mtime, но другим размером не должна попасть в кэш.
+        stat = pdf.stat()
+        pdf.write_bytes(b"%PDF-1.4\n%changed\n")
+        os.utime(pdf, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        rp_extractor._PAGE_TEXT_CACHE.clear()
+        assert rp_extractor.extract_page_text_pdfminer(pdf, 0) == "layer text"
+        assert calls == [0, 0]
+    finally:
+        rp_extractor._configure_disk_cache(None)
+
+
+def test_disk_cache_keys_do_not_depend_on_working_directory(tmp_path, monkeypatch):
+    pdf = _make_pdf(tmp_path, "layer.pdf")
+    (tmp_path / "sub").mkdir()
+    calls = []
+
+    def fake_extract_text(path, page_numbers):
+        calls.append(path)
+        return "layer text"
+
+    monkeypatch.setattr(rp_extractor, "_pdfminer_available", True)
+    monkeypatch.setattr(rp_extractor, "extract_text", fake_extract_text)
+    rp_extractor._configure_disk_cache(str(tmp_path / "cache" / "ocr.sqlite"))
+    try:
+        monkeypatch.chdir(tmp_path)
+        rp_extractor._PAGE_TEXT_CACHE.clear()
+        assert rp_extractor.extract_page_text_pdfminer(Path("layer.pdf"), 0) == "layer text"
+        monkeypatch.chdir(tmp_path / "sub")
+        rp_extractor._PAGE_TEXT_CACHE.clear()
+        assert rp_extractor.extract_page_text_pdfminer(Path("../layer.pdf"), 0) == "layer text"
+        assert len(calls) == 1
+        assert rp_extractor._ocr_cache_key(Path("../layer.pdf"), 0, 300, "rus")[0] == str(pdf)
+    finally:
+        rp_extractor._configure_disk_cache(None)
+
+
+def test_disk_cache_prunes_least_recently_used_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(rp_extractor, "_DISK_CACHE_PRUNE_EVERY", 1)
+    cache = rp_extractor._DiskCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+
+    cache.put("a", "text a")
+    cache.put("b", "text b")
+    assert cache.get("a") == "text a"
+    cache.put("c", "text c")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "text a"
+    assert cache.get("c") == "text c"
+
+
+def test_disk_cache_upgrades_table_without_access_column(tmp_path):
+    path = tmp_path / "old.sqlite"
+    conn = rp_extractor.sqlite3.connect(path)
+    conn.execute("CREATE TABLE cache (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    conn.execute(
+        "INSERT INTO cache (key, value) VALUES (?, ?)", (rp_extractor._DiskCache._digest("old"), "old text")
+    )
+    conn.commit()
+    conn.close()
+
+    cache = rp_extractor._DiskCache(str(path))
+
+    assert cache.get("old") == "old text"
+    cache.put("new", "new text")
+    assert cache.get("new") == "new text"
+
+
+def test_process_pdf_batch_ocr_runs_tesseract_once(tmp_path, monkeypatch):
+    pdf = _make_pdf(tmp_path, "scan.pdf")
+    runs = []
+
+    class FakeImage:
+        def __init__(self, name):
+            self.name = name
+
+        def save(self, path):
+            Path(path).write_text(self.name)
+
+    class FakeTesseract:
+        class pytesseract:
+            tesseract_cmd = "tesseract"
+
+        @staticmethod
+        def image_to_string(image, lang, config=""):
+            raise AssertionError("pages should be recognised in one batch")
+
+    def fake_run(cmd, **_kwargs):
+        runs.append(cmd)
+        listed = Path(cmd[1]).read_text().split()
+        pages = [Path(p).read_text() for p in listed]
+        Path(cmd[2] + ".txt").write_text("".join(f"ocr {name}\f" for name in pages))
+
+    def fake_sniff(text: str):
+        if text == "ocr img2":
+            return "80065036285004", "12345678"
+        return None, None
+
+    monkeypatch.setattr(rp_extractor, "OCR_AVAILABLE", True)
+    monkeypatch.setattr(
+        rp_extractor,
+        "convert_from_path",
+        lambda _path, dpi, first_page, last_page, **_k: [FakeImage(f"img{n}") for n in range(first_page, last_page + 1)],
+    )
+    monkeypatch.setattr(rp_extractor, "pytesseract", FakeTesseract)
+    monkeypatch.setattr(rp_extractor.subprocess, "run", fake_run)
+    monkeypatch.setattr(rp_extractor, "get_page_count", lambda _: 3)
+    monkeypatch.setattr(rp_extractor, "extract_page_text_pdfminer", lambda *_: "")
+    monkeypatch.setattr(rp_extractor, "sniff_track_code_with_labels", fake_sniff)
+    rp_extractor._OCR_TEXT_CACHE.clear()
+
+    res = rp_extractor.process_pdf(pdf, enable_ocr=True, ocr_fast_dpi=0, ocr_batch=True)
+
+    assert len(runs) == 1
+    assert res["method"] == "ocr"
+    assert res["track"] == "80065036285004"
+
+
+def test_extract_page_text_ocr_paddle_backend_with_tesseract_fallback(tmp_path, monkeypatch):
+    import types
+
+    pdf = _make_pdf(tmp_path, "scan.pdf")
+
+    class FakeImage:
+        def convert(self, mode):
+            return self
+
+    class FakePaddleOCR:
+        def __init__(self, **_kwargs):
+            pass
+
+        def ocr(self, array, cls):
+            return [[[None, ("Код доступа", 0.9)], [None, ("1234 5678", 0.9)]]]
+
+    class FakeTesseract:
+        @staticmethod
+        def image_to_string(image, lang, config=""):
+            return "tesseract text"
+
+    monkeypatch.setitem(sys.modules, "paddleocr", types.SimpleNamespace(PaddleOCR=FakePaddleOCR))
+    monkeypatch.setitem(sys.modules, "numpy", types.SimpleNamespace(asarray=lambda img: img))
+    monkeypatch.setattr(rp_extractor, "_PADDLE_ENGINE", None)
+    monkeypatch.setattr(rp_extractor, "_PADDLE_FAILED", False)
+    monkeypatch.setattr(rp_extractor, "OCR_AVAILABLE", True)
+    monkeypatch.setattr(rp_extractor, "convert_from_path", lambda *_a, **_k: [FakeImage()])
+    monkeypatch.setattr(rp_extractor, "pytesseract", FakeTesseract)
+    rp_extractor._OCR_TEXT_CACHE.clear()
+
+    assert rp_extractor.extract_page_text_ocr(pdf, 0, backend="paddle") == "Код доступа\n1234 5678"
+    assert rp_extractor.extract_page_text_ocr(pdf, 0) == "tesseract text"
+
+    monkeypatch.setattr(rp_extractor, "_PADDLE_ENGINE", None)
+    monkeypatch.setattr(rp_extractor, "_PADDLE_FAILED", True)
+    rp_extractor._OCR_TEXT_CACHE.clear()
+    assert rp_extractor.extract_page_text_ocr(pdf, 0, backend="paddle") == "tesseract text"
+
+
+def test_process_pdf_paddle_fallback_reuses_tesseract_cache_without_rendering(tmp_path, monkeypatch):
+    pdf = _make_pdf(tmp_path, "scan.pdf")
+    render_calls = []
+
+    def fake_convert(path, dpi, first_page, last_page, **_kwargs):
+        render_calls.append((first_page, last_page))
+        return [f"img{n}" for n in range(first_page, last_page + 1)]
+
+    class FakeTesseract:
+        @staticmethod
+        def image_to_string(image, lang, config=""):
+            return f"ocr {image}"
+
+    monkeypatch.setattr(rp_extractor, "_paddle_engine", lambda: None)
+    monkeypatch.setattr(rp_extractor, "OCR_AVAILABLE", True)
+    monkeypatch.setattr(rp_extractor, "convert_from_path", fake_convert)
+    monkeypatch.setattr(rp_extractor, "pytesseract", FakeTesseract)
+    monkeypatch.setattr(rp_extractor, "get_page_count", lambda _: 3)
+    monkeypatch.setattr(rp_extractor, "extract_page_text_pdfminer", lambda *_: "")
+    rp_extractor._OCR_TEXT_CACHE.clear()
+
+    kwargs = dict(max_pages_back=3, enable_ocr=True, ocr_fast_dpi=0, ocr_backend="paddle")
+    rp_extractor.process_pdf(pdf, **kwargs)
+    assert render_calls
+
+    # Тексты распознаны Tesseract и закэшированы под его ключом: повторный
+    # запуск с --ocr-backend paddle не должен рендерить страницы заново.
+    render_calls.clear()
+    res = rp_extractor.process_pdf(pdf, **kwargs)
+
+    assert render_calls == []
+    assert res["track"] is None
+
+
+def test_binarize_produces_one_bit_image():
+    Image = pytest.importorskip("PIL.Image")
+    img = Image.new("RGB", (4, 1))
+    img.putdata([(10, 10, 10), (120, 120, 120), (140, 140, 140), (250, 250, 250)])
+
+    bw = rp_extractor._binarize(img)
+
+    assert bw.mode == "1"
+    assert [bool(bw.getpixel((x, 0))) for x in range(4)] == [False, False, True, True]
+
+
+def test_crop_label_bands_keeps_top_third_and_bottom_quarter():
+    Image = pytest.importorskip("PIL.Image")
+    img = Image.new("L", (10, 120), 128)
+
+    bands = rp_extractor._crop_label_bands(img)
+
+    assert bands.size == (10, 40 + 30)
+
+
+def test_process_pdf_ocr_crop_falls_back_to_full_page(tmp_path, monkeypatch):
+    pdf = _make_pdf(tmp_path, "scan.pdf")
+    passes = []
+
+    def fake_ocr(_pdf, _pidx, dpi, binarize=False, crop=False, **_kwargs):
+        passes.append((dpi, binarize, crop))
+        return "full page" if not crop else "bands"
+
+    def fake_sniff(text: str):
+        if text == "full page":
+            return "80065036285004", "12345678"
+        return None, None
+
+    monkeypatch.setattr(rp_extractor, "get_page_count", lambda _: 1)
+    monkeypatch.setattr(rp_extractor, "extract_page_text_pdfminer", lambda *_: "")
+    monkeypatch.setattr(rp_extractor, "extract_page_text_ocr", fake_ocr)
+    monkeypatch.setattr(rp_extractor, "sniff_track_code_with_labels", fake_sniff)
+
+    res = rp_extractor.process_pdf(pdf, enable_ocr=True, ocr_dpi=300, ocr_fast_dpi=200, ocr_crop=True)
+    assert passes == [(200, True, True), (300, False, False)]
+    assert res["method"] == "ocr"
+
+    passes.clear()
+    rp_extractor.process_pdf(pdf, enable_ocr=True, ocr_dpi=300, ocr_fast_dpi=0, ocr_crop=True)
+    assert passes == [(300, False, True), (300, False, False)]
+
+
+def test_process_pdf_takes_only_code_from_ocr_when_text_layer_has_track(tmp_path, monkeypatch):
+    pdf = _make_pdf(tmp_path, "barcode.pdf")
+    passes = []
+    layer = "Почтовый идентификатор 80065036285004 " + "x" * 300
+
+    def fake_ocr(_pdf, pidx, dpi, binarize=False, crop=False, **_kwargs):
+        passes.append((pidx, dpi, crop))
+        return "bands"
+
+    def fake_sniff(text: str):
+        if text == layer:
+            return "80065036285004", None
+        if text == "bands":
+            return None, "12345678"
+        return None, None
+
+    monkeypatch.setattr(rp_extractor, "get_page_count", lambda _: 1)
+    monkeypatch.setattr(rp_extractor, "extract_page_text_pdfminer", lambda *_: layer)
+    monkeypatch.setattr(rp_extractor, "extract_page_text_ocr", fake_ocr)
+    monkeypatch.setattr(rp_extractor, "sniff_track_code_with_labels", fake_sniff)
+
+    res = rp_extractor.process_pdf(pdf, enable_ocr=True, ocr_dpi=300, ocr_fast_dpi=200)
+
+    # Страница с длинным слоем всё равно распознаётся, и сразу по полосам.
+    assert passes == [(0, 200, True)]
+    assert res["track"] == "80065036285004"
+    assert res["code"] == "12345678"
+    assert res["method"] == "text+ocr"
@@ -1,7 +1,4 @@
 from pathlib import Path
-import sys
-
-sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
 from rp_extractor import sniff_track_code_with_labels
 
@@ -117,3 +114,97 @@ def test_sniff_prefers_labelled_code_over_address_digits():
     assert track == "80104511649546"
     assert code == "81264026"
     
+
+
+def test_sniff_does_not_glue_digits_across_long_whitespace():
+    text = (
+        "ПОЧТА РОССИИ\n"
+        "Почтовый идентификатор: 8006 5036 2850 04\n"
+        "Код доступа: 1234 5678\n"
+        "8" + " " * 40 + "0" * 13 + "\n"
+    )
+    track, code = sniff_track_code_with_labels(text)
+    assert track == "80065036285004"
+    assert code == "12345678"
+
+
+def test_sniff_accepts_typographic_dashes_and_narrow_spaces():
+    text = (
+        "ПОЧТА РОССИИ\n"
+        "Почтовый идентификатор: 8006–5036‑2850 04\n"
+        "Код доступа: 1234−5678\n"
+    )
+    track, code = sniff_track_code_with_labels(text)
+    assert track == "80065036285004"
+    assert code == "12345678"
+
+
+def test_sniff_finds_numbers_after_long_ocr_noise():
+    noise = ("почтовое отправление 12 34 шпи трек " * 2000) + ("\n" + " " * 50) * 200
+    text = (
+        noise
+        + "\nПОЧТА РОССИИ\n"
+        + "Почтовый идентификатор: 8006 5036 2850 04\n"
+        + "Код доступа: 1234 5678\n"
+    )
+    track, code = sniff_track_code_with_labels(text)
+    assert track == "80065036285004"
+    assert code == "12345678"
+
+
+def test_sniff_strips_every_whitespace_separator_between_digits():
+    text = (
+        "ПОЧТА РОССИИ\n"
+        "Почтовый идентификатор: 8006\u20095036\u30002850\u200a04\n"
+        "Код доступа: 1234\u205f5678\n"
+    )
+    track, code = sniff_track_code_with_labels(text)
+    assert track == "80065036285004"
+    assert code == "12345678"
+
+
+def test_sniff_labelled_pair_wins_over_nearby_unlabelled_numbers():
+    # Текст OCR одной строкой: номер заказа ближе к трек-номеру, чем код.
+    text = (
+        "ПОЧТА РОССИИ Доступ код 9566 8099 Номер заказа 85548207 "
+        "Идентификатор отправления: 8645 7087 0649 52"
+    )
+    track, code = sniff_track_code_with_labels(text)
+    assert track == "86457087064952"
+    assert code == "95668099"
+
+
+def test_sniff_label_without_number_does_not_take_part_of_track():
+    # Вторая подпись кода пустая: первое число после неё — начало трека.
+    text = (
+        "Сумма 1234.56\nКод получения: 12345678\nШПИ 80065036285004\n"
+        "Телефон 8 800 100 00 00\nКод получения:\nПочта России\nДата 12.03.2024\n"
+        "Почтовый идентификатор:\nШПИ 80065036285004"
+    )
+    track, code = sniff_track_code_with_labels(text)
+    assert track == "80065036285004"
+    assert code == "12345678"
+
+
+def test_sniff_label_code_ignores_phone_number_below():
+    # Телефон ближе к трек-номеру, чем настоящий код.
+    text = (
+        "ПОЧТА РОССИИ\nКод для получения: 53007024\nКому: ООО «Ромашка»\n"
+        "Код для получения:\nТелефон 8 800 163 87 99\n"
+        "Почтовый идентификатор: 8929 8147 3057 59"
+    )
+    track, code = sniff_track_code_with_labels(text)
+    assert track == "89298147305759"
+    assert code == "53007024"
+
+
+def test_sniff_finds_code_in_text_without_digit_eight():
+    text = "Код для получения: 1234 5679\n"
+    track, code = sniff_track_code_with_labels(text)
+    assert track is None
+    assert code == "12345679"
+
+
+def test_sniff_text_without_digit_runs_returns_nothing():
+    text = "ПОЧТА РОССИИ\nКод подразделения 12, трек номер будет позже.\n" * 50
+    assert sniff_track_code_with_labels(text) == (None, None)
@@ -0,0 +1,217 @@
+"""Сравнивает версии sniff_track_code_with_labels на сгенерированных текстах.
+
+Каждая версия задаётся ревизией git (``HEAD``, ``HEAD~3``, хэш коммита) или
+путём к файлу с модулем. Для генераторов ``notice`` и ``layout`` известны
+правильные трек и код, поэтому выводится точность каждой версии и число
+текстов, которые первая версия разбирала верно, а данная — нет. Генератор
+``random`` правильных ответов не знает и годится для проверки, что версии
+дают одинаковый результат.
+
+Пример (результат одинаков при одинаковых --seed и --count)::
+
+    python tools/sniff_fuzz.py --generator notice --seed 1 --count 3000 d14b2d0~1 HEAD
+"""
+
+import argparse
+import importlib.util
+import random
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def load_sniffer(spec: str, tmp_dir: Path, idx: int):
+    """Загружает sniff_track_code_with_labels из файла или из ревизии git."""
+
+    path = Path(spec)
+    if not path.is_file():
+        source = subprocess.run(
+            ["git", "show", f"{spec}:rp_extractor.py"],
+            cwd=REPO_ROOT,
+            check=True,
+            capture_output=True,
+        ).stdout
+        path = tmp_dir / f"sniff_rev_{idx}.py"
+        path.write_bytes(source)
+    module_spec = importlib.util.spec_from_file_location(f"sniff_rev_{idx}", path)
+    module = importlib.util.module_from_spec(module_spec)
+    module_spec.loader.exec_module(module)
+    return module.sniff_track_code_with_labels
+
+
+def _num(rng: random.Random, n: int, first: str = "") -> str:
+    digits = "".join(rng.choice("0123456789") for _ in range(n))
+    return first + digits[len(first):]
+
+
+def _group(rng: random.Random, digits: str, sizes, seps) -> str:
+    out, i = [], 0
+    for size in sizes:
+        out.append(digits[i : i + size])
+        i += size
+    if i < len(digits):
+        out.append(digits[i:])
+    return rng.choice(seps).join(x for x in out if x)
+
+
+def gen_notice(rng: random.Random):
+    """Уведомление с подписями, пустыми подписями, телефонами 8-800, ИНН и суммами."""
+
+    seps = [" ", " ", "\xa0", "-", "  "]
+    track, code = _num(rng, 14, "8"), _num(rng, 8)
+
+    def fmt_track():
+        return rng.choice([track] + [_group(rng, track, s, seps) for s in ([4, 4, 4, 2], [6, 2, 5, 1], [3, 4, 3, 4])])
+
+    def fmt_code():
+        return rng.choice([code] + [_group(rng, code, s, seps) for s in ([4, 4], [2, 2, 2, 2])])
+
+    blocks = [rng.choice(["ПОЧТА РОССИИ", "Почта России", "", "ПОЧТА РОССИИ\nЭлектронное заказное письмо"])]
+    track_label = rng.choice(["Почтовый идентификатор:", "Трек-номер:", "ШПИ", "Идентификатор отправления"])
+    code_label = rng.choice(["Код доступа:", "Код для получения:", "Код получения:", "Код письма:"])
+    body = [
+        track_label + rng.choice([" ", "\n", ": "]) + fmt_track(),
+        code_label + rng.choice([" ", "\n", ": "]) + fmt_code(),
+    ]
+    noise = [
+        f"Куда: {_num(rng, 6)}, г. Москва",
+        f"ИНН {_num(rng, rng.choice([10, 12]))}",
+        f"Тел.: +7 {_num(rng, 3)} {_num(rng, 3)}-{_num(rng, 2)}-{_num(rng, 2)}",
+        f"Телефон 8 800 {_num(rng, 3)} {_num(rng, 2)} {_num(rng, 2)}",
+        f"Дата {rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.2024",
+        "Кому: ООО «Ромашка»",
+        f"ОГРН {_num(rng, 13)}",
+        f"Сумма {rng.randint(100, 9999)}.{_num(rng, 2)}",
+        f"Номер заказа {_num(rng, rng.choice([9, 14]))}",
+        code_label,
+        track_label,
+        "Почта России",
+        f"ШПИ {fmt_track()}",
+    ]
+    body += rng.sample(noise, rng.randint(0, len(noise)))
+    rng.shuffle(body)
+    blocks += body
+    return rng.choice(["\n", "\n\n"]).join(blocks), (track, code)
+
+
+def gen_layout(rng: random.Random):
+    """Уведомление с кодом над подписью, переносами внутри номеров и реквизитами."""
+
+    seps = [" ", " ", "\xa0", "-", "  ", "\n"]
+
+    def track():
+        digits = _num(rng, 14, "8")
+        return digits, rng.choice([digits] + [_group(rng, digits, s, seps) for s in ([4, 4, 4, 2], [6, 2, 5, 1], [3, 4, 3, 4])])
+
+    def code():
+        digits = _num(rng, 8)
+        return digits, rng.choice([digits] + [_group(rng, digits, s, seps) for s in ([4, 4], [2, 2, 2, 2])])
+
+    blocks = [rng.choice(["ПОЧТА РОССИИ", "Почта России", "", "ПОЧТА РОССИИ\nЭлектронное заказное письмо"])]
+    track_label = rng.choice(["Почтовый идентификатор:", "Трек-номер:", "ШПИ", "Идентификатор отправления", "Трек номер", "штрих-код"])
+    code_label = rng.choice(["Код доступа:", "Код для получения:", "Код получения", "Код письма:", "Доступ код"])
+    track_digits, track_text = track()
+    code_digits, code_text = code()
+    label_seps = [" ", "\n", ": "]
+    track_block = track_label + rng.choice(label_seps) + track_text
+    code_block = code_label + rng.choice(label_seps) + code_text
+    if rng.random() < 0.15:
+        code_digits, code_text = code()
+        code_block = f"{code_text}\n{code_label}"
+    noise = [
+        f"Куда: {_num(rng, 6)}, г. Москва, ул. Ленина, д. {rng.randint(1, 99)}",
+        f"ИНН {_num(rng, rng.choice([10, 12]))}",
+        f"Тел.: +7 {_num(rng, 3)} {_num(rng, 3)}-{_num(rng, 2)}-{_num(rng, 2)}",
+        f"Дата: {rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.2024",
+        "Кому: ООО «Ромашка»",
+        f"ОГРН {_num(rng, 13)}",
+        "Получайте и отправляйте письма онлайн.",
+        f"Счёт {_num(rng, 20)}",
+        f"Номер заказа {_num(rng, rng.choice([8, 9, 14]))}",
+        f"Исх. № {_num(rng, 5)}",
+    ]
+    body = [track_block, code_block] + rng.sample(noise, rng.randint(0, len(noise)))
+    rng.shuffle(body)
+    blocks += body
+    return rng.choice(["\n", "\n\n", " "]).join(blocks), (track_digits, code_digits)
+
+
+_RANDOM_FRAGMENTS = [
+    "ПОЧТА РОССИИ", "Почтовый идентификатор:", "Трек-номер", "трек номер", "ШПИ", "Код доступа:",
+    "Код для получения:", "код письма", "Получайте и отправляйте письма онлайн.", "Адрес:", "ИНН",
+    "штрих код", "идентификатор отправления", "Кому:", "доступ код", "получения", "\n", "\n", "\n",
+    " ", ": ", "-", "\xa0", " ", " ", "№", "Куда: 199034, г. Москва",
+]
+
+
+def gen_random(rng: random.Random):
+    """Случайная смесь подписей и групп цифр; правильный ответ неизвестен."""
+
+    parts = []
+    if rng.random() < 0.3:
+        # Текст, открывающийся логотипом, в том числе с буквой или цифрой сразу после него.
+        parts.append(rng.choice(["", " ", "\n"]) + rng.choice(["ПОЧТА РОССИИ", "Почта\nРоссии"]))
+        parts.append(rng.choice(["", " ", "\n", ":", "к", "-", "1"]))
+    for _ in range(rng.randint(1, 25)):
+        if rng.random() < 0.35:
+            digits = _num(rng, rng.choice([4, 6, 8, 8, 10, 13, 14, 14, 16]))
+            if rng.random() < 0.5:
+                digits = "8" + digits[1:]
+            out = []
+            for ch in digits:
+                out.append(ch)
+                if rng.random() < 0.25:
+                    out.append(rng.choice([" ", " ", "\n", "-", "\xa0", "  "]))
+            parts.append("".join(out))
+        else:
+            parts.append(rng.choice(_RANDOM_FRAGMENTS))
+        parts.append(rng.choice([" ", "\n", " ", ""]))
+    return "".join(parts), None
+
+
+GENERATORS = {"notice": gen_notice, "layout": gen_layout, "random": gen_random}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("sniffers", nargs="+", help="ревизии git или пути к файлам; первая — эталон")
+    ap.add_argument("--generator", choices=sorted(GENERATORS), default="notice")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--count", type=int, default=3000)
+    ap.add_argument("--show", type=int, default=0, help="сколько расхождений напечатать")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sniffers = [load_sniffer(spec, Path(tmp), idx) for idx, spec in enumerate(args.sniffers)]
+        rng = random.Random(args.seed)
+        gen = GENERATORS[args.generator]
+        correct = [0] * len(sniffers)
+        differs = [0] * len(sniffers)
+        regressions = [0] * len(sniffers)
+        shown = 0
+        for _ in range(args.count):
+            text, truth = gen(rng)
+            results = [sniff(text) for sniff in sniffers]
+            for idx, res in enumerate(results):
+                if res != results[0]:
+                    differs[idx] += 1
+                    if shown < args.show:
+                        shown += 1
+                        print(f"{args.sniffers[idx]}: {res} vs {results[0]} truth={truth}\n{text!r}\n")
+                if truth is not None:
+                    correct[idx] += res == truth
+                    regressions[idx] += results[0] == truth and res != truth
+
+    print(f"generator={args.generator} seed={args.seed} count={args.count}")
+    for idx, spec in enumerate(args.sniffers):
+        line = f"{spec}: differs from {args.sniffers[0]}: {differs[idx]}"
+        if args.generator != "random":
+            line += f", accuracy {correct[idx] / args.count:.1%}, regressions {regressions[idx]}"
+        print(line)
+
+
+if __name__ == "__main__":
+    sys.exit(main())